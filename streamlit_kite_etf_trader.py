@@ -48,26 +48,56 @@ CMD ["streamlit", "run", "streamlit_kite_etf_trader.py", "--server.port=8501", "
 """
 
 import os
+import re
 import time
+import queue
 import threading
 import sqlite3
+import tempfile
 import json
-from datetime import datetime, timezone, timedelta
-from typing import Optional, Dict, Any, List
-
+import logging
+import logging.handlers
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timezone, timedelta
+from typing import Optional, Dict, Any, List, Tuple
+
+import numpy as np
 import pandas as pd
+import requests
 import streamlit as st
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 try:
     import plotly.graph_objs as go
 except ImportError:
     go = None
 
+# Optional JIT for the watchlist metrics kernel; NumPy path is used when absent
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
+# Optional faster JSON encoder for trade/GTT metadata; stdlib json is used when absent
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Optional parquet engine for the on-disk OHLC cache; history is only memoized in-process when absent
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
 # Optional imports; catch-friendly if kiteconnect not installed
 try:
-    from kiteconnect import KiteConnect
+    from kiteconnect import KiteConnect, KiteTicker
 except Exception:
     KiteConnect = None
+    KiteTicker = None
 
 # ---- Configuration ----
 load_dotenv()
@@ -80,6 +110,9 @@ TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
 
 DB_FILE = os.getenv("DB_FILE", "trades.db")
+INSTRUMENT_CACHE_FILE = os.getenv("INSTRUMENT_CACHE_FILE", "instrument_tokens.json")
+OHLC_CACHE_DIR = os.getenv("OHLC_CACHE_DIR", "cache")
+OHLC_CACHE_TTL = int(os.getenv("OHLC_CACHE_TTL_SECONDS", "3600"))
 POLL_INTERVAL = int(os.getenv("POLL_INTERVAL_SECONDS", "5"))  # seconds between LTP polls
 TIMEZONE = os.getenv("TIMEZONE", "Asia/Kolkata")
 
@@ -102,6 +135,90 @@ LOSS_ALERT_PERCENT = float(os.getenv("LOSS_ALERT_PERCENT", "5.0"))
 # DRY_RUN default - set to False for LIVE TRADING
 DRY_RUN_DEFAULT = os.getenv("DRY_RUN", "True").lower() == "true"
 
+# Stream LTPs over the KiteTicker websocket; REST polling is used whenever the feed is down
+USE_TICKER = os.getenv("USE_TICKER", "True").lower() == "true"
+
+# Watchlists at least this large use the Numba kernel (JIT warm-up isn't worth it below)
+NUMBA_MIN_SYMBOLS = int(os.getenv("NUMBA_MIN_SYMBOLS", "2000"))
+
+# HTTPAdapter settings for the shared keep-alive requests.Session (Kite REST + Telegram).
+# Retry only covers connection failures and GET reads, so order and GTT place/modify/cancel
+# (POST/PUT/DELETE) are never replayed after the server may already have acted on them.
+HTTP_POOL = {
+    "pool_connections": 4,
+    "pool_maxsize": 16,
+    "max_retries": Retry(total=3, backoff_factor=0.2, allowed_methods=frozenset({"GET"})),
+}
+
+# Margins are reused for this long; a poll cycle with several triggers makes at most one margins call
+MARGINS_CACHE_TTL = POLL_INTERVAL
+
+# After a failed instruments download, quotes fall back to NSE:SYM keys for this long before retrying
+INSTRUMENT_RETRY_SECONDS = 300
+
+# How long to wait for the websocket order update before asking the REST order history
+ORDER_UPDATE_TIMEOUT = 10
+
+# Most recent websocket order updates kept for wait_for_order (the socket pushes every order on the account)
+ORDER_UPDATES_MAX = 500
+
+# Workers in the shared pool that overlaps Kite REST round-trips (bounded to stay under rate limits)
+KITE_IO_WORKERS = 8
+
+# Kite's quote endpoint accepts at most this many instruments per request
+QUOTE_BATCH_LIMIT = 500
+
+# Quote requests allowed per second; callers only wait once this budget is actually spent
+QUOTE_RATE_LIMIT = 3
+
+# How long the trade writer collects queued records before committing them as one batch,
+# and the most records it puts in one transaction during a burst
+TRADE_FLUSH_INTERVAL = 0.1
+TRADE_FLUSH_MAX_BATCH = 500
+
+# A batch that keeps failing to commit is retried this many times, then appended to the spill file
+# as JSON lines so no trade record is lost
+TRADE_WRITE_RETRIES = 3
+TRADE_SPILL_FILE = os.getenv("TRADE_SPILL_FILE", "trades_unwritten.jsonl")
+
+# Upper bound on candles sent to the browser for the chart
+MAX_CHART_BARS = int(os.getenv("MAX_CHART_BARS", "500"))
+
+# Per-symbol polling chatter is logged at DEBUG; trade execution stays at INFO and above
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
+# Rotating log file written next to the console output (empty disables it)
+LOG_FILE = os.getenv("LOG_FILE", "etf_trader.log")
+LOG_FILE_MAX_BYTES = 5 * 1024 * 1024
+LOG_FILE_BACKUPS = 3
+
+# ---- Logging ----
+logger = logging.getLogger("etf_trader")
+
+
+@st.cache_resource
+def _start_log_listener() -> logging.handlers.QueueListener:
+    # Handlers do the stdout I/O on the listener thread, so polling/trading threads only enqueue.
+    # cache_resource keeps one listener (and one attached handler) across Streamlit reruns.
+    log_queue = queue.Queue()
+    formatter = logging.Formatter("%(asctime)s %(levelname)s %(threadName)s: %(message)s")
+    handlers = [logging.StreamHandler()]
+    if LOG_FILE:
+        handlers.append(logging.handlers.RotatingFileHandler(
+            LOG_FILE, maxBytes=LOG_FILE_MAX_BYTES, backupCount=LOG_FILE_BACKUPS, encoding="utf-8"
+        ))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    logger.propagate = False
+    return listener
+
+
+_start_log_listener()
+logger.setLevel(LOG_LEVEL)
+
 # ---- ETF Instruments Fetcher ----
 
 @st.cache_data(ttl=3600)  # Cache for 1 hour
@@ -191,10 +308,110 @@ def utc_to_local(dt: datetime) -> datetime:
     return dt.astimezone()
 
 
+@st.cache_resource
+def get_io_executor() -> ThreadPoolExecutor:
+    # One bounded pool for the whole process; cache_resource stops reruns from leaking executors
+    return ThreadPoolExecutor(max_workers=KITE_IO_WORKERS, thread_name_prefix="kite-io")
+
+
+EXEC = get_io_executor()
+
+# Panels decorated with this rerun on their own when their widgets change (st.fragment needs Streamlit >= 1.37)
+fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None)
+if fragment is None:
+    logger.warning("⚠️ Streamlit %s has no st.fragment - panels rerun with the whole page (upgrade to >= 1.37)", st.__version__)
+    fragment = lambda func: func
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` calls per `per` seconds, sleeping only for the exact deficit"""
+
+    def __init__(self, rate: float, per: float = 1.0):
+        self.rate = rate
+        self.per = per
+        self.tokens = float(rate)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate / self.per)
+            self.updated = now
+            self.tokens -= 1
+            # A negative balance reserves a future slot; concurrent callers queue up behind it
+            wait = -self.tokens * self.per / self.rate if self.tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+
+
+@st.cache_resource
+def get_quote_bucket() -> TokenBucket:
+    # Shared by reruns, the monitor thread and EXEC workers so the budget is process-wide
+    return TokenBucket(QUOTE_RATE_LIMIT, 1.0)
+
+
+QUOTE_BUCKET = get_quote_bucket()
+
+
+@st.cache_resource
+def get_http_session() -> requests.Session:
+    # One keep-alive session for all outbound HTTPS; bursts of alerts and REST calls skip the TCP+TLS handshake
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(**HTTP_POOL))
+    return session
+
+
+# ---- Vectorized watchlist metrics ----
+
+def _compute_metrics_numpy(ltp: np.ndarray, prev: np.ndarray, qty: np.ndarray, avg: np.ndarray):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pct = np.where(prev != 0, (ltp - prev) / prev * 100.0, np.nan)
+    pnl = (ltp - avg) * qty
+    return pct, pnl
+
+
+if njit is not None:
+    # No fastmath: missing quotes are NaN and must propagate as NaN
+    @njit(parallel=True, cache=True)
+    def _compute_metrics_numba(ltp, prev, qty, avg):
+        pct = np.empty_like(ltp)
+        pnl = np.empty_like(ltp)
+        for i in prange(ltp.size):
+            pct[i] = (ltp[i] - prev[i]) / prev[i] * 100.0 if prev[i] != 0 else np.nan
+            pnl[i] = (ltp[i] - avg[i]) * qty[i]
+        return pct, pnl
+else:
+    _compute_metrics_numba = None
+
+
+def compute_metrics(ltp: np.ndarray, prev: np.ndarray, qty: np.ndarray, avg: np.ndarray):
+    """
+    Compute % vs previous close and unrealized P&L for a whole watchlist.
+    Inputs are float64 arrays of equal length; missing values should be NaN.
+    Returns (pct_vs_prev, unrealized_pnl) arrays, NaN where not computable.
+    """
+    if _compute_metrics_numba is not None and ltp.size >= NUMBA_MIN_SYMBOLS:
+        return _compute_metrics_numba(ltp, prev, qty, avg)
+    return _compute_metrics_numpy(ltp, prev, qty, avg)
+
+
 # ---- Persistence (SQLite) ----
 
+def _apply_pragmas(conn: sqlite3.Connection):
+    # WAL lets readers proceed while the monitor thread writes; the other pragmas are per-connection
+    if DB_FILE != ":memory:":  # in-memory databases can't use WAL
+        mode = conn.execute("PRAGMA journal_mode=WAL").fetchone()
+        if not mode or str(mode[0]).lower() != "wal":
+            logger.warning("⚠️ SQLite WAL mode not enabled for %s (journal_mode=%s)", DB_FILE, mode[0] if mode else None)
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA mmap_size=134217728")
+
+
 def init_db():
     conn = sqlite3.connect(DB_FILE, check_same_thread=False)
+    _apply_pragmas(conn)
     cur = conn.cursor()
     cur.execute(
         """
@@ -220,7 +437,8 @@ def init_db():
             buy_timestamp TEXT,
             target_price REAL,
             status TEXT,
-            product TEXT DEFAULT 'CNC'
+            product TEXT DEFAULT 'CNC',
+            loss_threshold REAL
         )
         """
     )
@@ -230,6 +448,23 @@ def init_db():
         cur.execute("ALTER TABLE positions ADD COLUMN product TEXT DEFAULT 'CNC'")
     except sqlite3.OperationalError:
         pass  # Column already exists
+    
+    # Stop-loss level is fixed when the position is written; backfill rows from older databases
+    try:
+        cur.execute("ALTER TABLE positions ADD COLUMN loss_threshold REAL")
+    except sqlite3.OperationalError:
+        pass  # Column already exists
+    cur.execute(
+        "UPDATE positions SET loss_threshold = avg_buy_price * (1 - ? / 100.0) WHERE loss_threshold IS NULL",
+        (LOSS_ALERT_PERCENT,),
+    )
+    
+    # Partial covering index over open positions: calculate_allocated_capital's SUM scans
+    # only open rows and never touches the table itself
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_positions_open ON positions(status, qty, avg_buy_price) "
+        "WHERE status NOT IN ('TARGET_HIT', 'SOLD')"
+    )
     cur.execute(
         """
         CREATE TABLE IF NOT EXISTS gtt_orders (
@@ -254,43 +489,150 @@ def init_db():
     return conn
 
 DB = init_db()
-DB_LOCK = threading.Lock()
+DB_LOCK = threading.Lock()  # serializes writes on the shared DB connection
+
+_DB_LOCAL = threading.local()
+
+
+def get_conn() -> sqlite3.Connection:
+    """
+    Per-thread autocommit connection for reads.
+    With WAL enabled these don't need DB_LOCK and never block on the writer.
+    """
+    conn = getattr(_DB_LOCAL, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DB_FILE, check_same_thread=False, isolation_level=None)
+        _apply_pragmas(conn)
+        _DB_LOCAL.conn = conn
+    return conn
+
+
+TRADE_INSERT_SQL = "INSERT INTO trades (symbol, qty, side, price, timestamp, order_id, dry_run, extra) VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+
+
+def _trade_writer_loop(trade_queue: queue.Queue):
+    """
+    Drain queued trade rows and commit them in batches of up to TRADE_FLUSH_MAX_BATCH
+    (one executemany inside an explicit BEGIN/COMMIT per batch).
+    A threading.Event in the queue is a flush request: everything queued before it is
+    committed immediately and the event is set.
+    A batch that still fails after TRADE_WRITE_RETRIES attempts is appended to TRADE_SPILL_FILE.
+    """
+    conn = sqlite3.connect(DB_FILE, check_same_thread=False, isolation_level=None)
+    _apply_pragmas(conn)
+    while True:
+        batch, waiters = [], []
+        item = trade_queue.get()
+        deadline = time.monotonic() + TRADE_FLUSH_INTERVAL
+        while True:
+            if isinstance(item, threading.Event):
+                waiters.append(item)
+                break
+            batch.append(item)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or len(batch) >= TRADE_FLUSH_MAX_BATCH:
+                break
+            try:
+                item = trade_queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+        
+        for attempt in range(1, TRADE_WRITE_RETRIES + 1):
+            if not batch:
+                break
+            try:
+                conn.execute("BEGIN")
+                conn.executemany(TRADE_INSERT_SQL, batch)
+                conn.execute("COMMIT")
+                load_recent_trades_df.clear()
+                break
+            except Exception as e:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                logger.error("❌ Failed to write %s trade records (attempt %d/%d): %s",
+                             len(batch), attempt, TRADE_WRITE_RETRIES, e)
+                if attempt < TRADE_WRITE_RETRIES:
+                    time.sleep(0.5 * attempt)
+        else:
+            _spill_trades(batch)
+        for waiter in waiters:
+            waiter.set()
+
+
+def _spill_trades(batch: List[tuple]):
+    """Append trade rows the DB would not take to TRADE_SPILL_FILE (one JSON object per line)"""
+    columns = ("symbol", "qty", "side", "price", "timestamp", "order_id", "dry_run", "extra")
+    try:
+        with open(TRADE_SPILL_FILE, "a") as f:
+            f.write("".join(json.dumps(dict(zip(columns, row))) + "\n" for row in batch))
+            f.flush()
+            os.fsync(f.fileno())
+        logger.error("❌ Spilled %s unwritten trade records to %s", len(batch), TRADE_SPILL_FILE)
+    except OSError as e:
+        logger.critical("❌ Lost %s trade records (DB and %s both failed): %s", len(batch), TRADE_SPILL_FILE, e)
+
+
+@st.cache_resource
+def _start_trade_writer() -> queue.Queue:
+    # cache_resource keeps a single queue + writer thread across Streamlit reruns
+    trade_queue = queue.Queue()
+    threading.Thread(target=_trade_writer_loop, args=(trade_queue,), daemon=True, name="trade-writer").start()
+    return trade_queue
+
+
+TRADE_QUEUE = _start_trade_writer()
+
+
+def _json_serializer(obj):
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj)} is not JSON serializable")
 
 
 def safe_json_dumps(obj):
     """Safely serialize objects to JSON, handling datetime objects"""
-    def json_serializer(obj):
-        if isinstance(obj, datetime):
-            return obj.isoformat()
-        raise TypeError(f"Object of type {type(obj)} is not JSON serializable")
-    
-    return json.dumps(obj, default=json_serializer)
+    if orjson is not None:
+        # orjson handles datetimes natively; decode so the column keeps holding TEXT
+        return orjson.dumps(obj, default=_json_serializer, option=orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(obj, default=_json_serializer)
 
-def save_trade(symbol: str, qty: int, side: str, price: float, order_id: Optional[str], dry_run: bool, extra: Optional[Dict] = None):
-    with DB_LOCK:
-        cur = DB.cursor()
-        cur.execute(
-            "INSERT INTO trades (symbol, qty, side, price, timestamp, order_id, dry_run, extra) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-            (symbol, qty, side, price, datetime.now(timezone.utc).isoformat(), order_id or "", 1 if dry_run else 0, safe_json_dumps(extra or {})),
-        )
-        DB.commit()
+def save_trade(symbol: str, qty: int, side: str, price: float, order_id: Optional[str], dry_run: bool,
+               extra: Optional[Dict] = None, timestamp: Optional[str] = None):
+    """
+    Queue a trade record without blocking; the writer thread commits it within TRADE_FLUSH_INTERVAL.
+    Pass timestamp to share one isoformat string with the position row written for the same fill.
+    """
+    TRADE_QUEUE.put(
+        (symbol, qty, side, price, timestamp or datetime.now(timezone.utc).isoformat(), order_id or "",
+         1 if dry_run else 0, safe_json_dumps(extra or {}))
+    )
+
+
+def flush_trades(timeout: float = 5.0) -> bool:
+    """Block until every trade queued so far has been committed. Returns False on timeout."""
+    done = threading.Event()
+    TRADE_QUEUE.put(done)
+    return done.wait(timeout)
 
 
 def upsert_position(symbol: str, qty: int, avg_buy_price: float, buy_timestamp: str, target_price: float, status: str, product: str = "CNC"):
+    # Single-statement UPSERT (SQLite >= 3.24): no SELECT-then-write race, one statement per call.
+    # The stop-loss level is derived here once, so exit checks compare prices without recomputing it.
+    loss_threshold = avg_buy_price * (1 - LOSS_ALERT_PERCENT / 100.0)
     with DB_LOCK:
-        cur = DB.cursor()
-        cur.execute("SELECT symbol FROM positions WHERE symbol = ?", (symbol,))
-        if cur.fetchone():
-            cur.execute(
-                "UPDATE positions SET qty=?, avg_buy_price=?, buy_timestamp=?, target_price=?, status=?, product=? WHERE symbol = ?",
-                (qty, avg_buy_price, buy_timestamp, target_price, status, product, symbol),
-            )
-        else:
-            cur.execute(
-                "INSERT INTO positions(symbol, qty, avg_buy_price, buy_timestamp, target_price, status, product) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                (symbol, qty, avg_buy_price, buy_timestamp, target_price, status, product),
-            )
+        DB.execute(
+            """
+            INSERT INTO positions(symbol, qty, avg_buy_price, buy_timestamp, target_price, status, product, loss_threshold)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(symbol) DO UPDATE SET
+                qty=excluded.qty, avg_buy_price=excluded.avg_buy_price, buy_timestamp=excluded.buy_timestamp,
+                target_price=excluded.target_price, status=excluded.status, product=excluded.product,
+                loss_threshold=excluded.loss_threshold
+            """,
+            (symbol, qty, avg_buy_price, buy_timestamp, target_price, status, product, loss_threshold),
+        )
         DB.commit()
+    _clear_positions_cache()
 
 
 def has_active_position(symbol: str) -> bool:
@@ -298,11 +640,10 @@ def has_active_position(symbol: str) -> bool:
     Check if a symbol already has an active position (BOUGHT status)
     Returns True if position exists and is not sold yet
     """
-    with DB_LOCK:
-        cur = DB.cursor()
-        cur.execute("SELECT status FROM positions WHERE symbol = ? AND status = 'BOUGHT'", (symbol,))
-        result = cur.fetchone()
-        return result is not None
+    cur = get_conn().cursor()
+    cur.execute("SELECT status FROM positions WHERE symbol = ? AND status = 'BOUGHT'", (symbol,))
+    result = cur.fetchone()
+    return result is not None
 
 
 def has_pending_gtt(symbol: str) -> bool:
@@ -310,11 +651,37 @@ def has_pending_gtt(symbol: str) -> bool:
     Check if a symbol already has a pending GTT order
     Returns True if there's an active GTT for this symbol
     """
-    with DB_LOCK:
-        cur = DB.cursor()
-        cur.execute("SELECT status FROM gtt_orders WHERE symbol = ? AND status = 'ACTIVE'", (symbol,))
-        result = cur.fetchone()
-        return result is not None
+    cur = get_conn().cursor()
+    cur.execute("SELECT status FROM gtt_orders WHERE symbol = ? AND status = 'ACTIVE'", (symbol,))
+    result = cur.fetchone()
+    return result is not None
+
+
+def can_buy(symbol: str) -> Tuple[bool, str]:
+    """
+    Combined single-order guard for manual buys.
+    Checks bought_today in memory, then active position and pending GTT in one query.
+    Returns (allowed, reason) where reason is empty when allowed.
+    """
+    if symbol in MONITOR_STATE["bought_today"]:
+        return False, f"Already bought {symbol} today! Only one order per symbol per day is allowed."
+    
+    cur = get_conn().cursor()
+    cur.execute(
+        """
+        SELECT
+            EXISTS(SELECT 1 FROM positions WHERE symbol = ? AND status = 'BOUGHT'),
+            EXISTS(SELECT 1 FROM gtt_orders WHERE symbol = ? AND status = 'ACTIVE')
+        """,
+        (symbol, symbol),
+    )
+    active_position, pending_gtt = cur.fetchone()
+    
+    if active_position:
+        return False, f"{symbol} already has an active position! Wait for it to sell before buying again."
+    if pending_gtt:
+        return False, f"{symbol} already has a pending GTT order! Cancel it first or wait for execution."
+    return True, ""
 
 
 def cleanup_sold_positions():
@@ -332,7 +699,8 @@ def cleanup_sold_positions():
             # Remove sold positions
             cur.execute("DELETE FROM positions WHERE status = 'SOLD'")
             DB.commit()
-            print(f"🧹 Cleaned up {sold_count} sold positions to allow new trades")
+            _clear_positions_cache()
+            logger.info("🧹 Cleaned up %s sold positions to allow new trades", sold_count)
             
         return sold_count
 
@@ -341,17 +709,53 @@ def get_position_summary() -> Dict[str, int]:
     """
     Get summary of positions by status
     """
-    with DB_LOCK:
-        cur = DB.cursor()
-        cur.execute("SELECT status, COUNT(*) FROM positions GROUP BY status")
-        results = cur.fetchall()
-        return dict(results) if results else {}
+    cur = get_conn().cursor()
+    cur.execute("SELECT status, COUNT(*) FROM positions GROUP BY status")
+    results = cur.fetchall()
+    return dict(results) if results else {}
 
 
-def load_positions_df() -> pd.DataFrame:
-    with DB_LOCK:
-        df = pd.read_sql_query("SELECT * FROM positions", DB)
-    return df
+# Dashboard loaders are cached for one poll interval; the write paths clear them so
+# a rerun right after a trade/position/GTT change still sees fresh rows.
+@st.cache_data(ttl=POLL_INTERVAL)
+def load_positions_rows(held_only: bool = False) -> List[Dict[str, Any]]:
+    """
+    Position rows for the dashboard (sell form, quick actions) as name-indexable dicts.
+    Plain dicts rather than sqlite3.Row so st.cache_data can store them.
+    """
+    cur = get_conn().cursor()
+    cur.row_factory = sqlite3.Row
+    cur.execute("SELECT * FROM positions WHERE qty > 0" if held_only else "SELECT * FROM positions")
+    return [dict(row) for row in cur.fetchall()]
+
+
+# Row layout used by the exit checks (check_position_exits / build_monitor_arrays)
+EXIT_COLUMNS = "qty, avg_buy_price, target_price, status, loss_threshold"
+
+
+def load_positions_map(symbols: List[str], columns: str = EXIT_COLUMNS) -> Dict[str, tuple]:
+    """symbol -> (columns...) for every symbol in the list that has a position, in a single query"""
+    if not symbols:
+        return {}
+    placeholders = ",".join("?" * len(symbols))
+    cur = get_conn().execute(f"SELECT symbol, {columns} FROM positions WHERE symbol IN ({placeholders})", list(symbols))
+    return {row[0]: row[1:] for row in cur}
+
+
+@st.cache_data(ttl=POLL_INTERVAL)
+def load_watchlist_positions(symbols: Tuple[str, ...]) -> Dict[str, tuple]:
+    """Cached load_positions_map for the watchlist table; the monitor thread reads uncached"""
+    return load_positions_map(list(symbols), "qty, avg_buy_price, target_price, status, product")
+
+
+def _clear_positions_cache():
+    load_positions_rows.clear()
+    load_watchlist_positions.clear()
+
+
+@st.cache_data(ttl=POLL_INTERVAL)
+def load_recent_trades_df(limit: int = 50) -> pd.DataFrame:
+    return pd.read_sql_query("SELECT * FROM trades ORDER BY id DESC LIMIT ?", get_conn(), params=(limit,))
 
 
 # ---- GTT (Good Till Triggered) Functions ----
@@ -360,16 +764,18 @@ def save_gtt_order(symbol: str, gtt_id: str, trigger_type: str, trigger_price: f
                    order_type: str, quantity: int, price: float = None, condition: str = ">=", 
                    meta: dict = None):
     """Save GTT order to database"""
+    # Serialize before taking DB_LOCK so the lock only covers the INSERT itself
+    meta_json = safe_json_dumps(meta or {})
     with DB_LOCK:
         cur = DB.cursor()
         cur.execute(
             """INSERT INTO gtt_orders 
                (symbol, gtt_id, trigger_type, trigger_price, order_type, quantity, price, condition, meta)
                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-            (symbol, gtt_id, trigger_type, trigger_price, order_type, quantity, price, condition, 
-             safe_json_dumps(meta or {}))
+            (symbol, gtt_id, trigger_type, trigger_price, order_type, quantity, price, condition, meta_json)
         )
         DB.commit()
+    _clear_gtt_cache()
 
 def update_gtt_status(gtt_id: str, status: str, last_price: float = None):
     """Update GTT order status"""
@@ -386,19 +792,24 @@ def update_gtt_status(gtt_id: str, status: str, last_price: float = None):
                 (status, gtt_id)
             )
         DB.commit()
+    _clear_gtt_cache()
 
+@st.cache_data(ttl=POLL_INTERVAL)
 def load_active_gtts() -> pd.DataFrame:
     """Load active GTT orders"""
-    with DB_LOCK:
-        df = pd.read_sql_query("SELECT * FROM gtt_orders WHERE status='ACTIVE' ORDER BY created_at DESC", DB)
+    df = pd.read_sql_query("SELECT * FROM gtt_orders WHERE status='ACTIVE' ORDER BY created_at DESC", get_conn())
     return df
 
+@st.cache_data(ttl=POLL_INTERVAL)
 def load_all_gtts() -> pd.DataFrame:
     """Load all GTT orders"""
-    with DB_LOCK:
-        df = pd.read_sql_query("SELECT * FROM gtt_orders ORDER BY created_at DESC", DB)
+    df = pd.read_sql_query("SELECT * FROM gtt_orders ORDER BY created_at DESC", get_conn())
     return df
 
+def _clear_gtt_cache():
+    load_active_gtts.clear()
+    load_all_gtts.clear()
+
 def cancel_gtt_order(gtt_id: str):
     """Cancel a GTT order"""
     update_gtt_status(gtt_id, "CANCELLED")
@@ -406,6 +817,16 @@ def cancel_gtt_order(gtt_id: str):
 
 # ---- Kite wrapper (REST polling) ----
 
+@st.cache_resource
+def _margins_store() -> Dict[str, Any]:
+    # Shared by every KiteWrapper - the module-level KITE is rebuilt on each rerun, so a
+    # per-instance cache would never outlive a single render
+    return {"fetched_at": None, "margins": None}
+
+
+_MARGINS_CACHE = _margins_store()
+
+
 class KiteWrapper:
     def __init__(self, api_key: str, access_token: Optional[str]):
         if KiteConnect is None:
@@ -413,16 +834,19 @@ class KiteWrapper:
             self.kite = None
             return
         
+        # Share the process-wide keep-alive session, so every REST call
+        # (quote -> margins -> place_order -> order_history) reuses warm TLS connections
         self.kite = KiteConnect(api_key=api_key)
+        self.kite.reqsession = get_http_session()
         if access_token:
             self.kite.set_access_token(access_token)
             # Verify connection by checking profile
             try:
                 profile = self.kite.profile()
-                print(f"✅ Kite connected successfully for user: {profile.get('user_name', 'Unknown')}")
-                print(f"📊 Broker: {profile.get('broker', 'Unknown')}")
+                logger.info("✅ Kite connected successfully for user: %s", profile.get('user_name', 'Unknown'))
+                logger.info("📊 Broker: %s", profile.get('broker', 'Unknown'))
             except Exception as e:
-                print(f"❌ Kite connection failed: {e}")
+                logger.error("❌ Kite connection failed: %s", e)
                 st.error(f"Kite connection failed: {e}")
                 self.kite = None
 
@@ -432,24 +856,71 @@ class KiteWrapper:
             return None
             
         try:
-            # Ensure symbol has exchange prefix
-            if ":" not in symbol:
-                full_symbol = f"NSE:{symbol}"
-            else:
-                full_symbol = symbol
-                
-            # Call kite.quote with the symbol
-            q = self.kite.quote(full_symbol)
-            return q
+            # Call kite.quote with the instrument token when known (exchange-prefixed symbol otherwise)
+            return self._quote_chunk(self._quote_keys([symbol]), raise_errors=True)
         except Exception as e:
-            print(f"❌ Quote fetch failed for {symbol}: {e}")
+            logger.error("❌ Quote fetch failed for %s: %s", symbol, e)
             return None
 
+    def quote_batch(self, symbols: List[str], failed: Optional[set] = None) -> Dict[str, Any]:
+        """
+        Fetch quotes for many symbols with one request per QUOTE_BATCH_LIMIT instruments.
+        Returns Kite's response dict keyed by 'NSE:SYMBOL'; unknown symbols are simply absent.
+        If `failed` is given, the 'NSE:SYMBOL' keys of chunks that returned nothing are added to it.
+        """
+        if not self.kite or not symbols:
+            return {}
+        
+        keys = list(self._quote_keys(symbols).items())
+        chunks = [dict(keys[i:i + QUOTE_BATCH_LIMIT]) for i in range(0, len(keys), QUOTE_BATCH_LIMIT)]
+        # Watchlists beyond one request: overlap the chunk round-trips instead of paying them back to back
+        results = [self._quote_chunk(chunks[0])] if len(chunks) == 1 else list(EXEC.map(self._quote_chunk, chunks))
+        quotes = {}
+        for chunk, chunk_quotes in zip(chunks, results):
+            if not chunk_quotes and failed is not None:
+                failed.update(chunk.values())
+            quotes.update(chunk_quotes)
+        return quotes
+
+    @staticmethod
+    def _quote_keys(symbols: List[str]) -> Dict[str, str]:
+        """
+        Map each request identifier to its 'NSE:SYMBOL' key. Instrument tokens from the daily
+        NSE dump are sent where known so Kite skips the symbol lookup; others go by symbol.
+        """
+        keys = {}
+        for symbol in symbols:
+            full_symbol = kite_symbol(symbol)
+            token = get_instrument_token(full_symbol)
+            keys[str(token) if token is not None else full_symbol] = full_symbol
+        return keys
+
+    def _quote_chunk(self, keys: Dict[str, str], raise_errors: bool = False) -> Dict[str, Any]:
+        try:
+            QUOTE_BUCKET.acquire()
+            quotes = self.kite.quote(list(keys))
+        except Exception as e:
+            if raise_errors:
+                raise
+            logger.error("❌ Batch quote fetch failed for %s symbols: %s", len(keys), e)
+            return {}
+        # Kite keys the response by the identifiers sent; callers always look up 'NSE:SYMBOL'
+        return {keys[k]: v for k, v in quotes.items() if k in keys}
+
     def get_margins(self) -> Dict[str, Any]:
-        """Get account margins to verify available funds"""
+        """Get account margins to verify available funds (cached for MARGINS_CACHE_TTL seconds)"""
         if self.kite is None:
             raise RuntimeError("Kite client not initialized")
-        return self.kite.margins()
+        fetched_at, margins = _MARGINS_CACHE["fetched_at"], _MARGINS_CACHE["margins"]
+        if margins is not None and time.monotonic() - fetched_at < MARGINS_CACHE_TTL:
+            return margins
+        margins = self.kite.margins()
+        _MARGINS_CACHE.update(fetched_at=time.monotonic(), margins=margins)
+        return margins
+
+    def invalidate_margins(self):
+        """Drop cached margins so the next read reflects cash spent on an order"""
+        _MARGINS_CACHE["margins"] = None
     
     def get_order_history(self, order_id: str) -> List[Dict[str, Any]]:
         """Get order execution details"""
@@ -463,31 +934,38 @@ class KiteWrapper:
             raise RuntimeError("Kite client not initialized")
         return self.kite.positions()
 
-    def place_market_buy(self, symbol: str, qty: int) -> Dict[str, Any]:
-        """Place market buy order with MTF preference, fallback to CNC"""
+    def place_market_buy(self, symbol: str, qty: int, ltp: Optional[float] = None,
+                         available_cash: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Place market buy order with MTF preference, fallback to CNC.
+        Callers that already hold a fresh ltp / available_cash should pass them in;
+        only the missing ones are fetched for the pre-trade check.
+        """
         if self.kite is None:
             raise RuntimeError("Kite client not initialized")
         
         # Pre-trade validation
         try:
             # Check margins
-            margins = self.get_margins()
-            available_cash = margins.get('equity', {}).get('available', {}).get('live_balance', 0)
+            if available_cash is None:
+                margins = self.get_margins()
+                available_cash = margins.get('equity', {}).get('available', {}).get('live_balance', 0)
             
             # Get current quote for rough cost estimation
-            quote = self.quote(symbol)
-            if quote:
-                ltp = quote.get('last_price', 0)
+            if ltp is None:
+                quote = self.quote(symbol)
+                ltp = quote.get('last_price', 0) if quote else None
+            if ltp:
                 estimated_cost = ltp * qty * 1.1  # 10% buffer for price movement
                 
                 if available_cash < estimated_cost:
                     raise RuntimeError(f"Insufficient funds: Available ₹{available_cash:.2f}, Required ~₹{estimated_cost:.2f}")
             
-            print(f"💰 Available cash: ₹{available_cash:.2f}")
-            print(f"🛒 Placing BUY order: {qty} x {symbol}")
+            logger.info("💰 Available cash: ₹%.2f", available_cash)
+            logger.info("🛒 Placing BUY order: %s x %s", qty, symbol)
             
         except Exception as e:
-            print(f"⚠️ Pre-trade validation warning: {e}")
+            logger.warning("⚠️ Pre-trade validation warning: %s", e)
         
         # Try MTF first, then fallback to CNC
         order_response = None
@@ -495,7 +973,7 @@ class KiteWrapper:
         
         try:
             # First attempt: MTF (Margin Trading Facility)
-            print(f"🔄 Attempting MTF buy order for {symbol}")
+            logger.info("🔄 Attempting MTF buy order for %s", symbol)
             order_response = self.kite.place_order(
                 tradingsymbol=symbol, 
                 exchange="NSE", 
@@ -506,11 +984,11 @@ class KiteWrapper:
                 product="MTF"
             )
             product_used = "MTF"
-            print(f"✅ MTF order placed successfully for {symbol}")
+            logger.info("✅ MTF order placed successfully for %s", symbol)
             
         except Exception as mtf_error:
-            print(f"❌ MTF order failed for {symbol}: {mtf_error}")
-            print(f"🔄 Falling back to CNC for {symbol}")
+            logger.error("❌ MTF order failed for %s: %s", symbol, mtf_error)
+            logger.info("🔄 Falling back to CNC for %s", symbol)
             
             try:
                 # Fallback: CNC (Cash and Carry)
@@ -524,11 +1002,13 @@ class KiteWrapper:
                     product="CNC"
                 )
                 product_used = "CNC"
-                print(f"✅ CNC order placed successfully for {symbol}")
+                logger.info("✅ CNC order placed successfully for %s", symbol)
                 
             except Exception as cnc_error:
                 raise RuntimeError(f"Both MTF and CNC orders failed for {symbol}. MTF: {mtf_error}, CNC: {cnc_error}")
         
+        self.invalidate_margins()
+        
         # Add product type to response for tracking
         if isinstance(order_response, dict):
             order_response["product_used"] = product_used
@@ -544,17 +1024,16 @@ class KiteWrapper:
         
         # If product not specified, get it from the position data
         if product is None:
-            with DB_LOCK:
-                cur = DB.cursor()
-                cur.execute("SELECT product FROM positions WHERE symbol = ? AND status IN ('BOUGHT', 'TARGET_HIT')", (symbol,))
-                row = cur.fetchone()
-                if row:
-                    product = row[0]
-                else:
-                    product = "CNC"  # Default fallback
-                    print(f"⚠️ No position found for {symbol}, defaulting to CNC")
+            cur = get_conn().cursor()
+            cur.execute("SELECT product FROM positions WHERE symbol = ? AND status IN ('BOUGHT', 'TARGET_HIT')", (symbol,))
+            row = cur.fetchone()
+            if row:
+                product = row[0]
+            else:
+                product = "CNC"  # Default fallback
+                logger.warning("⚠️ No position found for %s, defaulting to CNC", symbol)
         
-        print(f"📤 Placing SELL order: {qty} x {symbol} @ ₹{price:.2f} ({product})")
+        logger.info("📤 Placing SELL order: %s x %s @ ₹%.2f (%s)", qty, symbol, price, product)
         
         return self.kite.place_order(
             tradingsymbol=symbol, 
@@ -575,17 +1054,16 @@ class KiteWrapper:
         
         # If product not specified, get it from the position data
         if product is None:
-            with DB_LOCK:
-                cur = DB.cursor()
-                cur.execute("SELECT product FROM positions WHERE symbol = ? AND status IN ('BOUGHT', 'TARGET_HIT')", (symbol,))
-                row = cur.fetchone()
-                if row:
-                    product = row[0]
-                else:
-                    product = "CNC"  # Default fallback
-                    print(f"⚠️ No position found for {symbol}, defaulting to CNC")
+            cur = get_conn().cursor()
+            cur.execute("SELECT product FROM positions WHERE symbol = ? AND status IN ('BOUGHT', 'TARGET_HIT')", (symbol,))
+            row = cur.fetchone()
+            if row:
+                product = row[0]
+            else:
+                product = "CNC"  # Default fallback
+                logger.warning("⚠️ No position found for %s, defaulting to CNC", symbol)
         
-        print(f"🚨 Placing MARKET SELL: {qty} x {symbol} ({product})")
+        logger.info("🚨 Placing MARKET SELL: %s x %s (%s)", qty, symbol, product)
         
         return self.kite.place_order(
             tradingsymbol=symbol, 
@@ -634,16 +1112,15 @@ class KiteWrapper:
                 product = "MTF"  # Try MTF first for buy orders
             else:  # SELL orders
                 # For sell orders, use the same product type as the original buy
-                with DB_LOCK:
-                    cur = DB.cursor()
-                    cur.execute("SELECT product FROM positions WHERE symbol = ? AND status IN ('BOUGHT', 'TARGET_HIT')", (symbol,))
-                    row = cur.fetchone()
-                    if row:
-                        product = row[0]
-                        print(f"🔄 Using {product} for SELL GTT (matching original buy product)")
-                    else:
-                        product = "CNC"  # Default fallback
-                        print(f"⚠️ No position found for {symbol}, defaulting to CNC for SELL GTT")
+                cur = get_conn().cursor()
+                cur.execute("SELECT product FROM positions WHERE symbol = ? AND status IN ('BOUGHT', 'TARGET_HIT')", (symbol,))
+                row = cur.fetchone()
+                if row:
+                    product = row[0]
+                    logger.info("🔄 Using %s for SELL GTT (matching original buy product)", product)
+                else:
+                    product = "CNC"  # Default fallback
+                    logger.warning("⚠️ No position found for %s, defaulting to CNC for SELL GTT", symbol)
             
         try:
             gtt_params = {
@@ -660,7 +1137,7 @@ class KiteWrapper:
                 }]
             }
             
-            print(f"🎯 Placing GTT: {transaction_type} {quantity} x {symbol} when price {condition} ₹{trigger_price} ({product})")
+            logger.info("🎯 Placing GTT: %s %s x %s when price %s ₹%s (%s)", transaction_type, quantity, symbol, condition, trigger_price, product)
             
             response = self.kite.place_gtt(**gtt_params)
             gtt_id = response.get("trigger_id")
@@ -678,14 +1155,14 @@ class KiteWrapper:
                 meta={"transaction_type": transaction_type, "product": product}
             )
             
-            print(f"✅ GTT placed successfully. ID: {gtt_id}")
+            logger.info("✅ GTT placed successfully. ID: %s", gtt_id)
             return response
             
         except Exception as e:
             # If MTF GTT fails for BUY orders, try CNC
             if product == "MTF" and transaction_type == "BUY":
-                print(f"❌ MTF GTT failed for {symbol}: {e}")
-                print(f"🔄 Retrying with CNC GTT for {symbol}")
+                logger.error("❌ MTF GTT failed for %s: %s", symbol, e)
+                logger.info("🔄 Retrying with CNC GTT for %s", symbol)
                 
                 try:
                     gtt_params["orders"][0]["product"] = "CNC"
@@ -706,14 +1183,14 @@ class KiteWrapper:
                         meta={"transaction_type": transaction_type, "product": "CNC"}
                     )
                     
-                    print(f"✅ CNC GTT placed successfully. ID: {gtt_id}")
+                    logger.info("✅ CNC GTT placed successfully. ID: %s", gtt_id)
                     return response
                     
                 except Exception as cnc_error:
-                    print(f"❌ Both MTF and CNC GTT failed for {symbol}")
+                    logger.error("❌ Both MTF and CNC GTT failed for %s", symbol)
                     raise RuntimeError(f"GTT placement failed. MTF: {e}, CNC: {cnc_error}")
             else:
-                print(f"❌ GTT placement failed: {e}")
+                logger.error("❌ GTT placement failed: %s", e)
                 raise e
     
     def get_gtts(self) -> List[Dict]:
@@ -724,7 +1201,7 @@ class KiteWrapper:
         try:
             return self.kite.get_gtts()
         except Exception as e:
-            print(f"❌ Error fetching GTTs: {e}")
+            logger.error("❌ Error fetching GTTs: %s", e)
             return []
     
     def cancel_gtt(self, gtt_id: str) -> Dict[str, Any]:
@@ -733,17 +1210,17 @@ class KiteWrapper:
             raise RuntimeError("Kite client not initialized")
             
         try:
-            print(f"❌ Cancelling GTT: {gtt_id}")
+            logger.info("❌ Cancelling GTT: %s", gtt_id)
             response = self.kite.cancel_gtt(gtt_id)
             
             # Update local database
             update_gtt_status(gtt_id, "CANCELLED")
             
-            print(f"✅ GTT cancelled successfully: {gtt_id}")
+            logger.info("✅ GTT cancelled successfully: %s", gtt_id)
             return response
             
         except Exception as e:
-            print(f"❌ GTT cancellation failed: {e}")
+            logger.error("❌ GTT cancellation failed: %s", e)
             raise e
     
     def modify_gtt(self, gtt_id: str, trigger_price: float, quantity: int, price: float = None) -> Dict[str, Any]:
@@ -782,18 +1259,188 @@ class KiteWrapper:
                 }]
             }
             
-            print(f"📝 Modifying GTT {gtt_id}: trigger=₹{trigger_price}, qty={quantity}")
+            logger.info("📝 Modifying GTT %s: trigger=₹%s, qty=%s", gtt_id, trigger_price, quantity)
             
             response = self.kite.modify_gtt(**gtt_params)
             
-            print(f"✅ GTT modified successfully: {gtt_id}")
+            logger.info("✅ GTT modified successfully: %s", gtt_id)
             return response
             
         except Exception as e:
-            print(f"❌ GTT modification failed: {e}")
+            logger.error("❌ GTT modification failed: %s", e)
             raise e
 
 
+# ---- Kite websocket feed (KiteTicker) ----
+
+class TickerFeed:
+    """
+    Keeps the latest LTP per symbol in memory from KiteTicker pushes.
+    Ticks that cross a symbol's buy threshold set `wake` so the monitor loop reacts immediately
+    instead of waiting for the next poll, and so do ticks that cross an open position's target or
+    stop level; the DB writes and alerts then run on the monitor thread, never on the websocket thread.
+    Order updates pushed on the same socket are kept by order_id so callers can wait for a fill
+    instead of polling the order history.
+    """
+    def __init__(self, api_key: str, access_token: str):
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.connected = False
+        self.ltp: Dict[str, float] = {}
+        self.symbol_by_token: Dict[int, str] = {}
+        self.buy_thresholds: Dict[str, float] = {}
+        self._below_threshold = set()
+        self.exit_levels: Dict[str, Tuple[float, float]] = {}  # symbol -> (target, loss threshold)
+        self._in_exit_zone = set()
+        self.order_updates: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()  # order_id -> latest update, oldest first
+        self._order_cond = threading.Condition()
+        
+        self.kws = KiteTicker(api_key, access_token)
+        self.kws.on_ticks = self._on_ticks
+        self.kws.on_order_update = self._on_order_update
+        self.kws.on_connect = self._on_connect
+        self.kws.on_close = self._on_close
+        self.kws.on_reconnect = self._on_reconnect
+        self.kws.on_error = self._on_error
+
+    def start(self):
+        self.kws.connect(threaded=True)
+
+    def subscribe(self, tokens: Dict[str, int]):
+        """Subscribe to symbol -> instrument_token pairs not already on the feed"""
+        with self.lock:
+            new_tokens = [t for t in tokens.values() if t not in self.symbol_by_token]
+            for symbol, token in tokens.items():
+                self.symbol_by_token[token] = symbol
+        if new_tokens and self.connected:
+            self.kws.subscribe(new_tokens)
+            self.kws.set_mode(self.kws.MODE_LTP, new_tokens)
+
+    def set_buy_threshold(self, symbol: str, threshold: Optional[float]):
+        with self.lock:
+            if threshold is None:
+                self.buy_thresholds.pop(symbol, None)
+                self._below_threshold.discard(symbol)
+            else:
+                self.buy_thresholds[symbol] = threshold
+
+    def set_exit_levels(self, symbol: str, levels: Optional[Tuple[float, float]]):
+        """(target, loss threshold) for an open position, or None once it has no open position"""
+        with self.lock:
+            if levels is None:
+                self.exit_levels.pop(symbol, None)
+                self._in_exit_zone.discard(symbol)
+            else:
+                self.exit_levels[symbol] = levels
+
+    def get_ltp(self, symbol: str) -> Optional[float]:
+        if not self.connected:
+            return None
+        with self.lock:
+            return self.ltp.get(symbol)
+
+    def snapshot(self) -> Dict[str, float]:
+        """Latest streamed LTPs, or {} while the websocket is down"""
+        if not self.connected:
+            return {}
+        with self.lock:
+            return dict(self.ltp)
+
+    def wait_for_order(self, order_id: str, timeout: float) -> Optional[Dict[str, Any]]:
+        """
+        Block until the order reaches a final status (COMPLETE / REJECTED / CANCELLED).
+        Returns the order update, or None on timeout or while the websocket is down.
+        The update is dropped from order_updates once it has been handed out.
+        """
+        def final_update():
+            update = self.order_updates.get(order_id)
+            if update and update.get("status") in ("COMPLETE", "REJECTED", "CANCELLED"):
+                return update
+            return None
+        
+        if not self.connected:
+            return None
+        with self._order_cond:
+            # Updates that arrived before we started waiting are already in order_updates
+            update = self._order_cond.wait_for(final_update, timeout)
+            if update is not None:
+                self.order_updates.pop(order_id, None)
+            return update
+
+    def _on_order_update(self, ws, data):
+        with self._order_cond:
+            order_id = str(data.get("order_id"))
+            self.order_updates[order_id] = data
+            self.order_updates.move_to_end(order_id)
+            # Orders nobody waits on (placed elsewhere on the account) age out here
+            while len(self.order_updates) > ORDER_UPDATES_MAX:
+                self.order_updates.popitem(last=False)
+            self._order_cond.notify_all()
+
+    def _on_connect(self, ws, response):
+        self.connected = True
+        with self.lock:
+            tokens = list(self.symbol_by_token)
+        if tokens:
+            ws.subscribe(tokens)
+            ws.set_mode(ws.MODE_LTP, tokens)
+        logger.info("✅ KiteTicker connected (%s instruments)", len(tokens))
+
+    def _on_close(self, ws, code, reason):
+        self.connected = False
+        logger.warning("⚠️ KiteTicker closed (%s): %s - falling back to REST polling", code, reason)
+
+    def _on_reconnect(self, ws, attempts_count):
+        logger.info("🔄 KiteTicker reconnecting (attempt %s)", attempts_count)
+
+    def _on_error(self, ws, code, reason):
+        logger.error("❌ KiteTicker error (%s): %s", code, reason)
+
+    def _on_ticks(self, ws, ticks):
+        crossed = False
+        with self.lock:
+            for tick in ticks:
+                symbol = self.symbol_by_token.get(tick.get("instrument_token"))
+                ltp = tick.get("last_price")
+                if symbol is None or ltp is None:
+                    continue
+                self.ltp[symbol] = ltp
+                
+                # Edge-triggered: wake only when the price moves from above to at/below the threshold
+                threshold = self.buy_thresholds.get(symbol)
+                if threshold is not None and ltp <= threshold:
+                    if symbol not in self._below_threshold:
+                        self._below_threshold.add(symbol)
+                        crossed = True
+                else:
+                    self._below_threshold.discard(symbol)
+                
+                # Same edge trigger for open positions reaching their target or stop level
+                levels = self.exit_levels.get(symbol)
+                if levels is not None and (ltp >= levels[0] or ltp <= levels[1]):
+                    if symbol not in self._in_exit_zone:
+                        self._in_exit_zone.add(symbol)
+                        crossed = True
+                else:
+                    self._in_exit_zone.discard(symbol)
+        if crossed:
+            self.wake.set()
+
+
+@st.cache_resource
+def get_ticker_feed(api_key: Optional[str], access_token: Optional[str]) -> Optional[TickerFeed]:
+    """Process-wide websocket feed (cache_resource keeps one connection across reruns)"""
+    if not USE_TICKER or KiteTicker is None or not api_key or not access_token:
+        return None
+    try:
+        feed = TickerFeed(api_key, access_token)
+        feed.start()
+        return feed
+    except Exception as e:
+        logger.error("❌ Could not start KiteTicker feed: %s", e)
+        return None
+
+
 # Instantiate Kite wrapper (may be None if not configured)
 KITE = None
 
@@ -807,9 +1454,9 @@ def get_kite_connection():
     if st.session_state.kite_connection is None and KITE_API_KEY and KITE_ACCESS_TOKEN:
         try:
             st.session_state.kite_connection = KiteWrapper(KITE_API_KEY, KITE_ACCESS_TOKEN)
-            print(f"✅ Created new Kite connection for session")
+            logger.info("✅ Created new Kite connection for session")
         except Exception as e:
-            print(f"❌ Failed to create Kite connection: {e}")
+            logger.error("❌ Failed to create Kite connection: %s", e)
             st.session_state.kite_connection = None
     
     return st.session_state.kite_connection
@@ -821,32 +1468,32 @@ def refresh_kite_connection():
     return get_kite_connection()
 
 # Capital management functions
-def fetch_real_account_balance():
-    """Fetch real account balance from Kite"""
+def fetch_real_account_balance() -> float:
+    """Fetch real account balance from Kite API"""
+    if not KITE or not KITE.kite:
+        logger.error("❌ Kite API not connected - cannot fetch real balance")
+        return 0.0
+    
     try:
-        kite_conn = get_kite_connection()
-        if not kite_conn or not kite_conn.kite:
-            print("❌ Kite connection not available")
-            return 0.0
-        
-        margins = kite_conn.kite.margins()
+        margins = KITE.get_margins()
         equity_margins = margins.get('equity', {})
         available_cash = equity_margins.get('available', {}).get('cash', 0.0)
         
-        print(f"💰 Real Account Balance: ₹{available_cash:,.2f}")
+        logger.info("💰 Real Account Balance: ₹%.2f", available_cash)
         return float(available_cash)
         
     except Exception as e:
-        print(f"❌ Error fetching account balance: {e}")
+        logger.error("❌ Error fetching account balance: %s", e)
         return 0.0
 
+
 def update_capital_allocation():
     """Update capital allocation based on real account balance"""
     # Fetch real balance
     total_capital = fetch_real_account_balance()
     
     if total_capital <= 0:
-        print("❌ Invalid account balance - cannot proceed with capital allocation")
+        logger.error("❌ Invalid account balance - cannot proceed with capital allocation")
         return False
     
     # Update MONITOR_STATE with real values
@@ -857,43 +1504,61 @@ def update_capital_allocation():
     deployment_capital = total_capital * (MONITOR_STATE["deployment_percentage"] / 100.0)
     reserve_capital = total_capital * (MONITOR_STATE["reserve_percentage"] / 100.0)
     
-    print(f"📊 Capital Allocation Updated:")
-    print(f"   Total Capital: ₹{total_capital:,.2f}")
-    print(f"   Deployment Capital (70%): ₹{deployment_capital:,.2f}")
-    print(f"   Reserve Capital (30%): ₹{reserve_capital:,.2f}")
+    logger.info("📊 Capital Allocation Updated:")
+    logger.info("   Total Capital: ₹%.2f", total_capital)
+    logger.info("   Deployment Capital (70%%): ₹%.2f", deployment_capital)
+    logger.info("   Reserve Capital (30%%): ₹%.2f", reserve_capital)
     
     return True
 
-# ---- Notifications ----
-
-import requests
 
+# ---- Notifications ----
 
 def send_telegram(message: str):
     if not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHAT_ID:
         return False
     try:
         url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
-        resp = requests.post(url, json={"chat_id": TELEGRAM_CHAT_ID, "text": message})
+        resp = get_http_session().post(url, json={"chat_id": TELEGRAM_CHAT_ID, "text": message}, timeout=3)
         return resp.ok
     except Exception as e:
-        print("Telegram send failed:", e)
+        logger.warning("Telegram send failed: %s", e)
         return False
 
 
+def _notify_loop(notify_queue: queue.Queue):
+    while True:
+        send_telegram(notify_queue.get())
+
+
+@st.cache_resource
+def _start_notifier() -> queue.Queue:
+    # cache_resource keeps a single queue + sender thread across Streamlit reruns
+    notify_queue = queue.Queue()
+    threading.Thread(target=_notify_loop, args=(notify_queue,), daemon=True, name="notifier").start()
+    return notify_queue
+
+
+NOTIFY_QUEUE = _start_notifier()
+
+
 def notify(message: str):
-    print("NOTIFY:", message)
-    send_telegram(message)
+    """Log the message and hand it to the sender thread; never blocks the caller on network I/O"""
+    logger.info("NOTIFY: %s", message)
+    if TELEGRAM_BOT_TOKEN and TELEGRAM_CHAT_ID:
+        NOTIFY_QUEUE.put(message)
     # TODO: add SMTP/email if needed
 
 # ---- Trading logic ----
 
 MONITOR_STATE = {
     "symbols": DEFAULT_WATCHLIST,
+    "full_by_bare": {},  # 'SYMBOL' -> 'NSE:SYMBOL' for Kite calls
+    "bare_by_full": {},  # 'NSE:SYMBOL' -> 'SYMBOL' for display / DB keys
     "qty": 10,  # Default quantity, will be dynamically calculated
     "dry_run": DRY_RUN_DEFAULT,
-    "last_prev_close": {},  # symbol -> prev_close
     "bought_today": set(),  # symbols bought today
+    "arr": {},  # watchlist as parallel arrays (symbol/ltp/prev/threshold/bought), rebuilt every tick
     
     # Dynamic Capital Allocation Parameters
     "total_capital": 0.0,  # Real account balance
@@ -904,6 +1569,25 @@ MONITOR_STATE = {
     "last_balance_update": None,    # When balance was last fetched
 }
 
+
+def set_watchlist(symbols: List[str]):
+    """Replace the watchlist, canonicalizing the Kite-facing names once instead of on every call"""
+    symbols_full = [s if ":" in s else f"NSE:{s}" for s in symbols]
+    MONITOR_STATE["symbols"] = symbols
+    MONITOR_STATE["full_by_bare"] = dict(zip(symbols, symbols_full))
+    MONITOR_STATE["bare_by_full"] = dict(zip(symbols_full, symbols))
+
+
+def kite_symbol(symbol: str) -> str:
+    """Exchange-prefixed name for Kite APIs; precomputed for watchlist symbols"""
+    full = MONITOR_STATE["full_by_bare"].get(symbol)
+    if full is None:
+        full = symbol if ":" in symbol else f"NSE:{symbol}"
+    return full
+
+
+set_watchlist(DEFAULT_WATCHLIST)
+
 # Initialize Kite and capital allocation
 if KITE_API_KEY:
     # Set global KITE for backward compatibility
@@ -913,14 +1597,14 @@ if KITE_API_KEY:
     kite_conn = get_kite_connection()
     if kite_conn and kite_conn.kite:
         # Update watchlist with ETFs from instruments API
-        MONITOR_STATE["symbols"] = get_watchlist_from_env_or_instruments(kite_conn.kite)
+        set_watchlist(get_watchlist_from_env_or_instruments(kite_conn.kite))
     else:
         # Fallback to environment or default
-        MONITOR_STATE["symbols"] = get_watchlist_from_env_or_instruments(None)
+        set_watchlist(get_watchlist_from_env_or_instruments(None))
     
     # Initialize capital allocation with real account balance
     if KITE and KITE.kite:
-        print("🏦 Initializing capital allocation with real account balance...")
+        logger.info("🏦 Initializing capital allocation with real account balance...")
         update_capital_allocation()
 
 
@@ -929,10 +1613,10 @@ def fetch_prev_close(symbol: str) -> Optional[float]:
     if KITE and KITE.kite:
         try:
             # Add NSE prefix if not present
-            nse_symbol = f"NSE:{symbol}" if ":" not in symbol else symbol
+            nse_symbol = kite_symbol(symbol)
             q = KITE.quote(symbol)  # Use KITE.quote (our wrapper method)
             if not q or nse_symbol not in q:
-                print(f"❌ No quote data returned for {symbol}")
+                logger.debug("No quote data returned for %s", symbol)
                 return None
             
             data = q[nse_symbol]
@@ -941,64 +1625,302 @@ def fetch_prev_close(symbol: str) -> Optional[float]:
             
             # Ensure we return a valid number or None
             if prev_close and isinstance(prev_close, (int, float)) and prev_close > 0:
-                print(f"✅ {symbol}: Previous close ₹{prev_close:.2f}")
+                logger.debug("%s: previous close ₹%.2f", symbol, prev_close)
                 return prev_close
             else:
-                print(f"❌ Invalid prev_close data for {symbol}: {prev_close}")
+                logger.debug("Invalid prev_close data for %s: %s", symbol, prev_close)
                 return None
         except Exception as e:
-            print(f"❌ Error fetching prev close for {symbol}: {e}")
+            logger.warning("Error fetching prev close for %s: %s", symbol, e)
             return None
     else:
         # DRY_RUN/test mode: return a fake previous close if not known
         return None
 
 
+@st.cache_resource
+def _prev_close_store() -> Tuple[Dict[str, Tuple[date, float, float]], threading.Lock]:
+    # Process-wide so Streamlit reruns and the monitor thread share one fetch per symbol per day
+    return {}, threading.Lock()
+
+
+# symbol -> (trading date, prev_close, gap-down buy threshold derived from it).
+# (date, None, None) records a symbol a successful batch quote returned no close for today.
+_PREV_CLOSE_CACHE, _PREV_CLOSE_LOCK = _prev_close_store()
+
+
+def _cache_prev_close(symbol: str, prev_close: float):
+    with _PREV_CLOSE_LOCK:
+        _PREV_CLOSE_CACHE[symbol] = (date.today(), prev_close, prev_close * (1 - BUY_GAP_PERCENT / 100.0))
+
+
+def _cache_prev_close_miss(symbol: str):
+    # Re-quoting can't succeed where the batch just came back empty; don't retry until tomorrow/Refresh
+    with _PREV_CLOSE_LOCK:
+        _PREV_CLOSE_CACHE[symbol] = (date.today(), None, None)
+
+
+def _prev_close_entries(symbols: List[str]) -> Dict[str, tuple]:
+    today = date.today()
+    with _PREV_CLOSE_LOCK:
+        entries = [(s, _PREV_CLOSE_CACHE.get(s)) for s in symbols]
+    return {s: e for s, e in entries if e and e[0] == today}
+
+
+def prev_close_levels(symbols: List[str]) -> Dict[str, Tuple[float, float]]:
+    """(prev_close, buy threshold) for symbols already cached today; never hits the network"""
+    return {s: (e[1], e[2]) for s, e in _prev_close_entries(symbols).items() if e[1] is not None}
+
+
+def prune_prev_close_cache() -> int:
+    """Drop entries from earlier trading days and today's recorded misses; today's values stay cached"""
+    today = date.today()
+    with _PREV_CLOSE_LOCK:
+        stale = [s for s, e in _PREV_CLOSE_CACHE.items() if e[0] != today or e[1] is None]
+        for symbol in stale:
+            del _PREV_CLOSE_CACHE[symbol]
+    return len(stale)
+
+
+def get_prev_close(symbol: str) -> Optional[float]:
+    """Cached previous close for today; fetched from Kite at most once per symbol per day"""
+    entry = _prev_close_entries([symbol]).get(symbol)
+    if entry:
+        return entry[1]
+    prev_close = fetch_prev_close(symbol)
+    if prev_close is not None:
+        _cache_prev_close(symbol, prev_close)
+    return prev_close
+
+
+def fill_prev_closes(symbols: List[str]) -> Dict[str, Tuple[float, float]]:
+    """
+    Fetch today's previous close for every symbol with nothing cached yet - i.e. after the batch
+    request itself failed; symbols a successful batch returned nothing for are recorded as misses
+    and skipped. The per-symbol calls run concurrently on the shared pool.
+    Returns prev_close_levels(symbols).
+    """
+    known = _prev_close_entries(symbols)
+    missing = [s for s in symbols if s not in known]
+    cached = prev_close_levels(symbols)
+    if missing and KITE and KITE.kite:
+        # Workers only return values - no Streamlit calls off the script thread
+        list(EXEC.map(get_prev_close, missing))
+        cached = prev_close_levels(symbols)
+    return cached
+
+
+@st.cache_resource
+def _instrument_token_store() -> Dict[str, Any]:
+    # Process-wide so Streamlit reruns don't re-read and re-parse the token file each time
+    return {"date": None, "tokens": {}, "failed_at": None, "lock": threading.Lock()}
+
+
+_INSTRUMENT_CACHE = _instrument_token_store()  # NSE tradingsymbol -> instrument_token
+
+
+def get_instrument_tokens() -> Dict[str, int]:
+    """
+    NSE tradingsymbol -> instrument_token map, refreshed once per trading day.
+    Tokens only change when Kite publishes a new instruments dump, so the map is
+    persisted to INSTRUMENT_CACHE_FILE and restarts on the same day skip the download.
+    A failed download is retried after INSTRUMENT_RETRY_SECONDS; until then the stale
+    (possibly empty) map is returned and quotes fall back to NSE:SYM keys.
+    """
+    today = datetime.now().date().isoformat()
+    if _INSTRUMENT_CACHE["date"] == today:
+        return _INSTRUMENT_CACHE["tokens"]
+    failed_at = _INSTRUMENT_CACHE["failed_at"]
+    if failed_at is not None and time.monotonic() - failed_at < INSTRUMENT_RETRY_SECONDS:
+        return _INSTRUMENT_CACHE["tokens"]
+    
+    # Render, monitor and pool threads can all see a stale date - only one of them refreshes
+    with _INSTRUMENT_CACHE["lock"]:
+        if _INSTRUMENT_CACHE["date"] == today:
+            return _INSTRUMENT_CACHE["tokens"]
+        failed_at = _INSTRUMENT_CACHE["failed_at"]
+        if failed_at is not None and time.monotonic() - failed_at < INSTRUMENT_RETRY_SECONDS:
+            return _INSTRUMENT_CACHE["tokens"]
+        
+        try:
+            with open(INSTRUMENT_CACHE_FILE, "r") as f:
+                cached = json.load(f)
+            if cached.get("date") == today:
+                _INSTRUMENT_CACHE.update(date=today, tokens=cached["tokens"], failed_at=None)
+                return _INSTRUMENT_CACHE["tokens"]
+        except (FileNotFoundError, ValueError, KeyError):
+            pass
+        
+        if not KITE or not KITE.kite:
+            return _INSTRUMENT_CACHE["tokens"]
+        try:
+            instruments = KITE.kite.instruments("NSE")
+            tokens = {i["tradingsymbol"]: i["instrument_token"] for i in instruments}
+            _INSTRUMENT_CACHE.update(date=today, tokens=tokens, failed_at=None)
+            logger.info("✅ Loaded %s NSE instrument tokens", len(tokens))
+        except Exception as e:
+            _INSTRUMENT_CACHE["failed_at"] = time.monotonic()
+            logger.error("❌ Error loading NSE instruments (retrying in %ss): %s", INSTRUMENT_RETRY_SECONDS, e)
+            return _INSTRUMENT_CACHE["tokens"]
+        
+        tmp_file = None
+        try:
+            fd, tmp_file = tempfile.mkstemp(
+                prefix=".instrument_tokens.", suffix=".tmp",
+                dir=os.path.dirname(os.path.abspath(INSTRUMENT_CACHE_FILE)),
+            )
+            with os.fdopen(fd, "w") as f:
+                json.dump({"date": today, "tokens": tokens}, f)
+            os.replace(tmp_file, INSTRUMENT_CACHE_FILE)
+        except OSError as e:
+            logger.warning("⚠️ Could not persist instrument tokens: %s", e)
+            if tmp_file and os.path.exists(tmp_file):
+                os.remove(tmp_file)
+    return _INSTRUMENT_CACHE["tokens"]
+
+
+def get_instrument_token(symbol: str) -> Optional[int]:
+    bare = MONITOR_STATE["bare_by_full"].get(symbol) or (symbol.split(":", 1)[1] if symbol.startswith("NSE:") else symbol)
+    return get_instrument_tokens().get(bare)
+
+
+def resolve_instrument_tokens(symbols: List[str]) -> Dict[str, int]:
+    """Map watchlist symbols to instrument tokens; unknown symbols are left out"""
+    tokens = get_instrument_tokens()
+    return {s: tokens[s] for s in symbols if s in tokens}
+
+
 def fetch_ltp(symbol: str) -> Optional[float]:
+    # Streamed price when the websocket has one; REST quote otherwise
+    feed = get_ticker_feed(KITE_API_KEY, KITE_ACCESS_TOKEN)
+    if feed:
+        ltp = feed.get_ltp(symbol)
+        if ltp is not None:
+            return ltp
     if KITE and KITE.kite:
         try:
             # Add NSE prefix if not present
-            nse_symbol = f"NSE:{symbol}" if ":" not in symbol else symbol
+            nse_symbol = kite_symbol(symbol)
             q = KITE.quote(symbol)  # Use KITE.quote (our wrapper method)
             if not q or nse_symbol not in q:
-                print(f"❌ No LTP data returned for {symbol}")
+                logger.debug("No LTP data returned for %s", symbol)
                 return None
             
             ltp = q[nse_symbol].get("last_price")
             if ltp:
-                print(f"✅ {symbol}: LTP ₹{ltp:.2f}")
+                logger.debug("%s: LTP ₹%.2f", symbol, ltp)
             
             return ltp
         except Exception as e:
-            print(f"❌ Error fetching LTP for {symbol}: {e}")
+            logger.warning("Error fetching LTP for %s: %s", symbol, e)
             return None
     else:
         return None
 
 
+def fetch_quotes_batch(symbols: List[str], failed_symbols: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Quotes for many symbols in one batched call, keyed by bare symbol.
+    Each entry has last_price, prev_close (ohlc.close), ohlc and volume; symbols Kite didn't
+    return are absent. Previous closes are stored in the day's prev-close cache on the way.
+    If `failed_symbols` is given, symbols whose batch request itself failed are appended to it.
+    """
+    if not KITE or not KITE.kite or not symbols:
+        return {}
+    failed = set()
+    quotes = KITE.quote_batch(symbols, failed)
+    cached = prev_close_levels(symbols)
+    result = {}
+    for symbol in symbols:
+        data = quotes.get(kite_symbol(symbol))
+        ohlc = (data or {}).get("ohlc") or {}
+        prev_close = ohlc.get("close")
+        if prev_close and symbol not in cached:
+            _cache_prev_close(symbol, prev_close)
+        elif not prev_close and symbol not in cached and kite_symbol(symbol) not in failed:
+            # The request went through but had no close for this symbol
+            _cache_prev_close_miss(symbol)
+        if not data:
+            continue
+        result[symbol] = {
+            "last_price": data.get("last_price"),
+            "prev_close": prev_close,
+            "ohlc": ohlc,
+            "volume": data.get("volume"),
+        }
+    if failed_symbols is not None:
+        failed_symbols.extend(s for s in symbols if kite_symbol(s) in failed)
+    return result
+
+
 def fetch_ohlc_history(symbol, interval="5minute", days=5):
     """Fetch OHLC historical data for the symbol from Kite (returns DataFrame)"""
     if not KITE or not KITE.kite:
         return None
     try:
-        from_date = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
-        to_date = datetime.now().strftime("%Y-%m-%d")
-        # Kite expects symbol with exchange prefix
-        kite_symbol = f"NSE:{symbol}" if ":" not in symbol else symbol
-        data = KITE.kite.historical_data(
-            KITE.kite.ltp([kite_symbol])[kite_symbol]['instrument_token'],
-            from_date,
-            to_date,
-            interval
-        )
-        import pandas as pd
-        df = pd.DataFrame(data)
-        return df
+        return _load_ohlc_history(symbol, interval, days, date.today().isoformat())
     except Exception as e:
-        print(f"❌ Error fetching OHLC for {symbol}: {e}")
+        logger.error("❌ Error fetching OHLC for %s: %s", symbol, e)
         return None
 
 
+@st.cache_data(ttl=OHLC_CACHE_TTL, show_spinner=False)
+def _load_ohlc_history(symbol: str, interval: str, days: int, as_of: str) -> pd.DataFrame:
+    """
+    Historical bars keyed by (symbol, interval, days, trading date). Failures raise so they
+    are not memoized. With pyarrow installed, each result is written through to
+    OHLC_CACHE_DIR and a restart within OHLC_CACHE_TTL reads it back instead of calling Kite.
+    """
+    cache_file = os.path.join(OHLC_CACHE_DIR, f"ohlc_{symbol}_{interval}_{days}_{as_of}.parquet")
+    if pyarrow is not None:
+        try:
+            if time.time() - os.path.getmtime(cache_file) < OHLC_CACHE_TTL:
+                return pd.read_parquet(cache_file)
+        except (OSError, ValueError):
+            pass
+    
+    from_date = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
+    to_date = datetime.now().strftime("%Y-%m-%d")
+    instrument_token = get_instrument_token(symbol)
+    if instrument_token is None:
+        # Not in the NSE dump (e.g. other exchange prefix) - resolve it via LTP
+        full_symbol = kite_symbol(symbol)
+        instrument_token = KITE.kite.ltp([full_symbol])[full_symbol]['instrument_token']
+    data = KITE.kite.historical_data(
+        instrument_token,
+        from_date,
+        to_date,
+        interval
+    )
+    df = pd.DataFrame(data)
+    
+    if pyarrow is not None and not df.empty:
+        try:
+            os.makedirs(OHLC_CACHE_DIR, exist_ok=True)
+            tmp_file = f"{cache_file}.tmp"
+            df.to_parquet(tmp_file, index=False)
+            os.replace(tmp_file, cache_file)
+        except Exception as e:
+            logger.warning("Could not persist OHLC cache for %s: %s", symbol, e)
+    return df
+
+
+def downsample_ohlc(df: pd.DataFrame, max_bars: int = MAX_CHART_BARS) -> pd.DataFrame:
+    """
+    Merge consecutive bars so at most max_bars candles remain.
+    Each bucket keeps first open/date, max high, min low, last close and summed volume,
+    so the chart shape (including wicks) is preserved.
+    """
+    if df is None or len(df) <= max_bars:
+        return df
+    bucket_size = -(-len(df) // max_bars)  # ceil division
+    buckets = np.arange(len(df)) // bucket_size
+    agg = {"date": "first", "open": "first", "high": "max", "low": "min", "close": "last"}
+    if "volume" in df.columns:
+        agg["volume"] = "sum"
+    return df.groupby(buckets).agg(agg).reset_index(drop=True)
+
+
 # ---- Token Validation Functions ----
 
 def check_token_validity():
@@ -1064,72 +1986,28 @@ def get_token_status_display():
 
 # ---- Dynamic Capital Allocation Functions ----
 
-def fetch_real_account_balance() -> float:
-    """Fetch real account balance from Kite API"""
-    if not KITE or not KITE.kite:
-        print("❌ Kite API not connected - cannot fetch real balance")
-        return 0.0
-    
-    try:
-        margins = KITE.kite.margins()
-        equity_margins = margins.get('equity', {})
-        available_cash = equity_margins.get('available', {}).get('cash', 0.0)
-        
-        print(f"💰 Real Account Balance: ₹{available_cash:,.2f}")
-        return float(available_cash)
-        
-    except Exception as e:
-        print(f"❌ Error fetching account balance: {e}")
-        return 0.0
-
-
-def update_capital_allocation():
-    """Update capital allocation based on real account balance"""
-    # Fetch real balance
-    total_capital = fetch_real_account_balance()
-    
-    if total_capital <= 0:
-        print("❌ Invalid account balance - cannot proceed with capital allocation")
-        return False
-    
-    # Update MONITOR_STATE with real values
-    MONITOR_STATE["total_capital"] = total_capital
-    MONITOR_STATE["last_balance_update"] = datetime.now().isoformat()
-    
-    # Calculate capital buckets
-    deployment_capital = total_capital * (MONITOR_STATE["deployment_percentage"] / 100.0)
-    reserve_capital = total_capital * (MONITOR_STATE["reserve_percentage"] / 100.0)
-    
-    print(f"📊 Capital Allocation Updated:")
-    print(f"   Total Capital: ₹{total_capital:,.2f}")
-    print(f"   Deployment Capital (70%): ₹{deployment_capital:,.2f}")
-    print(f"   Reserve Capital (30%): ₹{reserve_capital:,.2f}")
-    
-    return True
-
-
 def calculate_allocated_capital() -> float:
     """Calculate currently allocated capital from open positions"""
     if not DB:
         return 0.0
         
     try:
-        with DB_LOCK:
-            cur = DB.cursor()
-            cur.execute("""
-                SELECT SUM(qty * avg_buy_price) as total_allocated 
-                FROM positions 
-                WHERE status NOT IN ('TARGET_HIT', 'SOLD')
-            """)
-            result = cur.fetchone()
-            allocated = result[0] if result[0] else 0.0
+        cur = get_conn().cursor()
+        # WHERE clause must match idx_positions_open's for the planner to use it
+        cur.execute("""
+            SELECT SUM(qty * avg_buy_price) as total_allocated 
+            FROM positions 
+            WHERE status NOT IN ('TARGET_HIT', 'SOLD')
+        """)
+        result = cur.fetchone()
+        allocated = result[0] if result[0] else 0.0
             
         MONITOR_STATE["allocated_capital"] = allocated
-        print(f"💼 Currently Allocated Capital: ₹{allocated:,.2f}")
+        logger.debug("Currently allocated capital: ₹%.2f", allocated)
         return allocated
         
     except Exception as e:
-        print(f"❌ Error calculating allocated capital: {e}")
+        logger.error("Error calculating allocated capital: %s", e)
         return 0.0
 
 
@@ -1139,7 +2017,7 @@ def calculate_dynamic_trade_quantity(symbol: str, ltp: float) -> int:
     # Ensure capital allocation is up to date
     if not MONITOR_STATE["total_capital"] or not MONITOR_STATE["last_balance_update"]:
         if not update_capital_allocation():
-            print(f"❌ Cannot calculate quantity for {symbol} - capital allocation failed")
+            logger.warning("Cannot calculate quantity for %s - capital allocation failed", symbol)
             return 0
     
     # Calculate deployment capital and per-trade allocation
@@ -1150,25 +2028,24 @@ def calculate_dynamic_trade_quantity(symbol: str, ltp: float) -> int:
     allocated_capital = calculate_allocated_capital()
     available_deployment_capital = deployment_capital - allocated_capital
     
-    print(f"🧮 Dynamic Quantity Calculation for {symbol}:")
-    print(f"   Per-trade allocation (5% of deployment): ₹{per_trade_allocation:,.2f}")
-    print(f"   Available deployment capital: ₹{available_deployment_capital:,.2f}")
+    logger.debug("Dynamic quantity for %s: per-trade allocation ₹%.2f, available deployment capital ₹%.2f",
+                 symbol, per_trade_allocation, available_deployment_capital)
     
     # Check if we have enough available capital
     if available_deployment_capital < per_trade_allocation:
-        print(f"🛑 Insufficient deployment capital for {symbol}")
-        print(f"   Need: ₹{per_trade_allocation:,.2f}, Available: ₹{available_deployment_capital:,.2f}")
+        logger.info("Insufficient deployment capital for %s (need ₹%.2f, available ₹%.2f)",
+                    symbol, per_trade_allocation, available_deployment_capital)
         return 0
     
     # Calculate quantity based on LTP
     if ltp <= 0:
-        print(f"❌ Invalid LTP {ltp} for {symbol}")
+        logger.warning("Invalid LTP %s for %s", ltp, symbol)
         return 0
     
     quantity = int(per_trade_allocation / ltp)
     
     if quantity <= 0:
-        print(f"🛑 Calculated quantity is 0 for {symbol} (₹{per_trade_allocation:,.2f} / ₹{ltp:.2f})")
+        logger.info("Calculated quantity is 0 for %s (₹%.2f / ₹%.2f)", symbol, per_trade_allocation, ltp)
         return 0
     
     # Verify total cost doesn't exceed allocation
@@ -1177,7 +2054,7 @@ def calculate_dynamic_trade_quantity(symbol: str, ltp: float) -> int:
         quantity = int(per_trade_allocation / ltp)  # Recalculate to be safe
         total_cost = quantity * ltp
     
-    print(f"✅ Dynamic Quantity for {symbol}: {quantity} shares (₹{total_cost:,.2f})")
+    logger.info("Dynamic quantity for %s: %d shares (₹%.2f)", symbol, quantity, total_cost)
     
     return quantity
 
@@ -1214,121 +2091,156 @@ def verify_order_execution(order_id: str, symbol: str) -> Optional[Dict[str, Any
                 'pending_quantity': int(latest_order.get('pending_quantity', 0))
             }
     except Exception as e:
-        print(f"Error verifying order {order_id}: {e}")
+        logger.error("Error verifying order %s: %s", order_id, e)
         return None
 
 
-def check_and_execute_buy(symbol: str, qty: int, dry_run: bool):
-    """Enhanced buy logic with robust validation and execution tracking"""
+def wait_for_order_execution(order_id: str, symbol: str) -> Optional[Dict[str, Any]]:
+    """
+    Execution details for a just-placed order, in verify_order_execution()'s format.
+    Uses the websocket order update when the feed is up; the REST order history is only
+    consulted when no update arrives within ORDER_UPDATE_TIMEOUT.
+    """
+    feed = get_ticker_feed(KITE_API_KEY, KITE_ACCESS_TOKEN)
+    if feed is None or not feed.connected:
+        # No push channel - give the exchange a moment, then poll once
+        time.sleep(2)
+        return verify_order_execution(order_id, symbol)
+    
+    update = feed.wait_for_order(order_id, ORDER_UPDATE_TIMEOUT)
+    if update is None:
+        logger.warning("⚠️ No order update for %s within %ss - checking order history", order_id, ORDER_UPDATE_TIMEOUT)
+        return verify_order_execution(order_id, symbol)
+    
+    if update.get("status") == "COMPLETE":
+        return {
+            'status': 'COMPLETE',
+            'average_price': float(update.get('average_price', 0)),
+            'filled_quantity': int(update.get('filled_quantity', 0)),
+            'order_timestamp': update.get('order_timestamp')
+        }
+    return {
+        'status': update.get("status"),
+        'pending_quantity': int(update.get('pending_quantity', 0))
+    }
+
+
+def check_and_execute_buy(symbol: str, qty: int, dry_run: bool, ltp: Optional[float] = None,
+                          prev_close: Optional[float] = None):
+    """
+    Enhanced buy logic with robust validation and execution tracking.
+    ltp/prev_close may be supplied from a batched quote; missing values are fetched individually.
+    """
     
     # idempotency: one buy per symbol per day - multiple protection layers
     if symbol in MONITOR_STATE["bought_today"]:
-        print(f"🛑 Skipping {symbol}: Already bought today (in memory)")
+        logger.info("🛑 Skipping %s: Already bought today (in memory)", symbol)
         return
         
     # Additional protection: Check if position already exists in database
-    with DB_LOCK:
-        cur = DB.cursor()
-        cur.execute("SELECT COUNT(*) FROM positions WHERE symbol = ? AND status NOT IN ('TARGET_HIT', 'SOLD')", (symbol,))
-        if cur.fetchone()[0] > 0:
-            print(f"🛑 Skipping {symbol}: Active position already exists in database")
-            MONITOR_STATE["bought_today"].add(symbol)  # Add to memory protection too
-            return
+    cur = get_conn().cursor()
+    cur.execute("SELECT COUNT(*) FROM positions WHERE symbol = ? AND status NOT IN ('TARGET_HIT', 'SOLD')", (symbol,))
+    if cur.fetchone()[0] > 0:
+        logger.info("🛑 Skipping %s: Active position already exists in database", symbol)
+        MONITOR_STATE["bought_today"].add(symbol)  # Add to memory protection too
+        return
 
     # Validate symbol data availability
-    prev_close = MONITOR_STATE["last_prev_close"].get(symbol)
     if prev_close is None:
-        prev_close = fetch_prev_close(symbol)
+        prev_close = get_prev_close(symbol)
         if prev_close is None:
-            print(f"❌ Prev close unknown for {symbol}; skipping")
+            logger.warning("❌ Prev close unknown for %s; skipping", symbol)
             return
-        MONITOR_STATE["last_prev_close"][symbol] = prev_close
 
-    ltp = fetch_ltp(symbol)
     if ltp is None:
-        print(f"❌ LTP unavailable for {symbol}")
+        ltp = fetch_ltp(symbol)
+    if ltp is None:
+        logger.warning("❌ LTP unavailable for %s", symbol)
         return
 
     # Check buy condition
     if should_buy(symbol, ltp, prev_close):
         gap_percent = ((ltp - prev_close) / prev_close) * 100 if prev_close != 0 else 0
-        print(f"🎯 BUY TRIGGER: {symbol}")
-        print(f"   Previous Close: ₹{prev_close:.2f}")
-        print(f"   Current LTP: ₹{ltp:.2f}")
-        print(f"   Gap: {gap_percent:.2f}%")
+        logger.info("🎯 BUY TRIGGER: %s", symbol)
+        logger.info("   Previous Close: ₹%.2f", prev_close)
+        logger.info("   Current LTP: ₹%.2f", ltp)
+        logger.info("   Gap: %.2f%%", gap_percent)
         
         # � IMMEDIATE PROTECTION: Add to bought_today BEFORE any order processing
         # This prevents multiple concurrent orders for the same symbol
         MONITOR_STATE["bought_today"].add(symbol)
-        print(f"🔒 Added {symbol} to bought_today protection list")
+        logger.info("🔒 Added %s to bought_today protection list", symbol)
         
         # �🔥 DYNAMIC QUANTITY CALCULATION - Use real capital allocation
         dynamic_qty = calculate_dynamic_trade_quantity(symbol, ltp)
         if dynamic_qty <= 0:
-            print(f"🛑 Skipping {symbol}: Dynamic quantity calculation returned 0")
+            logger.info("🛑 Skipping %s: Dynamic quantity calculation returned 0", symbol)
             return
         
         # Use dynamic quantity instead of passed qty parameter
         qty = dynamic_qty
-        print(f"📊 Using dynamic quantity: {qty} shares for {symbol}")
+        logger.info("📊 Using dynamic quantity: %s shares for %s", qty, symbol)
         
         if dry_run:
             # Simulate executed price as current LTP
             executed_price = ltp
-            order_id = "DRYRUN-" + datetime.now(timezone.utc).isoformat()
+            fill_ts = datetime.now(timezone.utc).isoformat()
+            order_id = "DRYRUN-" + fill_ts
             save_trade(symbol, qty, "BUY", executed_price, order_id, True, {
                 "note": "dry_run simulated buy",
                 "gap_percent": gap_percent,
                 "prev_close": prev_close,
                 "product_used": "MTF"  # Simulate MTF for dry run
-            })
+            }, timestamp=fill_ts)
             target = executed_price * (1 + SELL_TARGET_PERCENT / 100.0)
             # Save position with MTF product type for dry run (simulating preferred MTF)
-            upsert_position(symbol, qty, executed_price, datetime.now(timezone.utc).isoformat(), target, "BOUGHT", "MTF")
+            upsert_position(symbol, qty, executed_price, fill_ts, target, "BOUGHT", "MTF")
             notify(f"[DRY_RUN] 📊 Bought {qty} {symbol} at ₹{executed_price:.2f} (Gap: {gap_percent:.2f}%) [MTF]; Target: ₹{target:.2f}")
         else:
             # LIVE TRADING - Enhanced execution with MTF/CNC support
             try:
-                print(f"🚀 PLACING LIVE BUY ORDER: {qty} x {symbol}")
+                logger.info("🚀 PLACING LIVE BUY ORDER: %s x %s", qty, symbol)
                 
                 # Place the order (will try MTF first, then CNC)
-                resp = KITE.place_market_buy(symbol, qty)
+                # Funds are checked against margins live_balance (cached for one poll by get_margins)
+                resp = KITE.place_market_buy(symbol, qty, ltp=ltp)
                 order_id = resp.get("order_id") if isinstance(resp, dict) else str(resp)
                 product_used = resp.get("product_used", "CNC")  # Track which product was used
                 
-                print(f"✅ Order placed successfully! Order ID: {order_id} (Product: {product_used})")
-                
-                # Wait a moment for order execution
-                time.sleep(2)
+                logger.info("✅ Order placed successfully! Order ID: %s (Product: %s)", order_id, product_used)
                 
-                # Verify order execution
-                execution_details = verify_order_execution(order_id, symbol)
+                # Wait for the fill (websocket order update, REST fallback)
+                execution_details = wait_for_order_execution(order_id, symbol)
                 
                 if execution_details and execution_details.get('status') == 'COMPLETE':
                     executed_price = execution_details['average_price']
                     filled_qty = execution_details['filled_quantity']
                     
-                    print(f"✅ ORDER EXECUTED:")
-                    print(f"   Filled Qty: {filled_qty}")
-                    print(f"   Average Price: ₹{executed_price:.2f}")
-                    print(f"   Product: {product_used}")
+                    logger.info("✅ ORDER EXECUTED:")
+                    logger.info("   Filled Qty: %s", filled_qty)
+                    logger.info("   Average Price: ₹%.2f", executed_price)
+                    logger.info("   Product: %s", product_used)
                     
                     # Save trade with actual execution details
+                    fill_ts = datetime.now(timezone.utc).isoformat()
                     save_trade(symbol, filled_qty, "BUY", executed_price, order_id, False, {
                         "kite_resp": resp,
                         "execution_details": execution_details,
                         "gap_percent": gap_percent,
                         "prev_close": prev_close,
                         "product_used": product_used
-                    })
+                    }, timestamp=fill_ts)
+                    
+                    # Make sure the fill is on disk before any sell orders go out
+                    flush_trades()
                     
                     # Calculate target and update position with product type
                     target = executed_price * (1 + SELL_TARGET_PERCENT / 100.0)
-                    upsert_position(symbol, filled_qty, executed_price, datetime.now(timezone.utc).isoformat(), target, "BOUGHT", product_used)
+                    upsert_position(symbol, filled_qty, executed_price, fill_ts, target, "BOUGHT", product_used)
                     
                     # Place GTT sell order with same product type
                     try:
-                        print(f"🎯 Setting up GTT sell target for {symbol} @ ₹{target:.2f} ({product_used})")
+                        logger.info("🎯 Setting up GTT sell target for %s @ ₹%.2f (%s)", symbol, target, product_used)
                         
                         sell_gtt = KITE.place_gtt(
                             symbol=symbol,
@@ -1341,11 +2253,11 @@ def check_and_execute_buy(symbol: str, qty: int, dry_run: bool):
                             product=product_used  # Use same product type
                         )
                         
-                        print(f"✅ GTT sell target placed! GTT ID: {sell_gtt.get('trigger_id')}")
+                        logger.info("✅ GTT sell target placed! GTT ID: %s", sell_gtt.get('trigger_id'))
                         notify(f"� [LIVE] GTT Target Set: {symbol} will sell {filled_qty} @ ₹{target:.2f} (+{SELL_TARGET_PERCENT}%) ({product_used})")
                         
                     except Exception as gtt_error:
-                        print(f"❌ Failed to place GTT sell target for {symbol}: {gtt_error}")
+                        logger.error("❌ Failed to place GTT sell target for %s: %s", symbol, gtt_error)
                         notify(f"⚠️ GTT Sell Setup Failed for {symbol}: {gtt_error}")
                     
                     notify(f"�🎉 [LIVE] BUY EXECUTED! {filled_qty} x {symbol} @ ₹{executed_price:.2f} | Gap: {gap_percent:.2f}% | Target: ₹{target:.2f} | Product: {product_used} | Order: {order_id}")
@@ -1361,16 +2273,16 @@ def check_and_execute_buy(symbol: str, qty: int, dry_run: bool):
                             "target_for_buy_order": order_id
                         })
                         
-                        print(f"🎯 Target sell order placed: {sell_order_id} @ ₹{target:.2f}")
+                        logger.info("🎯 Target sell order placed: %s @ ₹%.2f", sell_order_id, target)
                         notify(f"🎯 Target sell order placed: {filled_qty} x {symbol} @ ₹{target:.2f} | Order: {sell_order_id}")
                         
                     except Exception as sell_error:
-                        print(f"❌ Failed to place target sell order: {sell_error}")
+                        logger.error("❌ Failed to place target sell order: %s", sell_error)
                         notify(f"⚠️ Buy executed but failed to place sell order for {symbol}: {sell_error}")
                         
                 else:
                     # Order not filled or pending
-                    print(f"⏳ Order status: {execution_details.get('status') if execution_details else 'UNKNOWN'}")
+                    logger.info("⏳ Order status: %s", execution_details.get('status') if execution_details else 'UNKNOWN')
                     
                     # Save pending order
                     save_trade(symbol, qty, "BUY_PENDING", ltp, order_id, False, {
@@ -1384,7 +2296,7 @@ def check_and_execute_buy(symbol: str, qty: int, dry_run: bool):
                     
             except Exception as e:
                 error_msg = f"❌ Buy order FAILED for {symbol}: {str(e)}"
-                print(error_msg)
+                logger.error(error_msg)
                 notify(error_msg)
                 
                 # Save failed order attempt
@@ -1395,36 +2307,117 @@ def check_and_execute_buy(symbol: str, qty: int, dry_run: bool):
                 })
 
 
+def build_monitor_arrays(symbols: List[str], ltps: Dict[str, float],
+                         positions: Dict[str, tuple]) -> Dict[str, np.ndarray]:
+    """
+    Structure-of-arrays view of the watchlist for one monitor tick.
+    Missing prices are NaN, so every comparison against them is False.
+    """
+    n = len(symbols)
+    levels = prev_close_levels(symbols)
+    missing = (np.nan, np.nan)
+    arr = {
+        "symbol": np.array(symbols, dtype=object),
+        "ltp": np.array([ltps.get(s, np.nan) for s in symbols], dtype=np.float64),
+        "prev": np.array([levels.get(s, missing)[0] for s in symbols], dtype=np.float64),
+        "threshold": np.array([levels.get(s, missing)[1] for s in symbols], dtype=np.float64),
+        "bought": np.array([s in positions for s in symbols], dtype=bool),
+        "open": np.zeros(n, dtype=bool),
+        "target": np.full(n, np.nan),
+        "loss_threshold": np.full(n, np.nan),
+    }
+    for i, symbol in enumerate(symbols):
+        position = positions.get(symbol)
+        if position and position[3] not in ("TARGET_HIT", "SOLD"):
+            _, _, target_price, _, loss_threshold = position
+            arr["open"][i] = True
+            arr["target"][i] = target_price if target_price is not None else np.nan
+            arr["loss_threshold"][i] = loss_threshold if loss_threshold is not None else np.nan
+    return arr
+
+
+def check_position_exits(symbol: str, ltp: float, position: tuple, loop_count: int):
+    """Target / stop-loss handling for an open position"""
+    qty, avg_buy_price, target_price, status, loss_threshold = position
+    now_ts = datetime.now(timezone.utc).isoformat()
+    
+    current_pnl = (ltp - avg_buy_price) * qty
+    pnl_percent = ((ltp - avg_buy_price) / avg_buy_price) * 100 if avg_buy_price != 0 else 0
+    
+    # Check if target reached
+    if ltp >= target_price and status not in ["TARGET_HIT"]:
+        profit = (target_price - avg_buy_price) * qty
+        notify(f"🎯 TARGET HIT! {symbol}: LTP ₹{ltp:.2f} >= Target ₹{target_price:.2f} | Profit: ₹{profit:.2f} (+{pnl_percent:.2f}%)")
+        upsert_position(symbol, qty, avg_buy_price, now_ts, target_price, "TARGET_HIT")
+        
+        # 🔓 Remove from bought_today so it can be bought again if conditions are met
+        if symbol in MONITOR_STATE["bought_today"]:
+            MONITOR_STATE["bought_today"].discard(symbol)
+            logger.info("🔓 Removed %s from bought_today protection - available for new trades", symbol)
+    
+    # Check stop loss alert (but don't auto-sell)
+    if ltp <= loss_threshold and status not in ["ALERTED", "STOP_LOSS_HIT"]:
+        loss = (ltp - avg_buy_price) * qty
+        notify(f"🚨 STOP LOSS ALERT! {symbol}: LTP ₹{ltp:.2f} <= Threshold ₹{loss_threshold:.2f} | Loss: ₹{loss:.2f} ({pnl_percent:.2f}%)")
+        notify(f"🚨 Consider selling {qty} shares of {symbol} manually!")
+        upsert_position(symbol, qty, avg_buy_price, now_ts, target_price, "ALERTED")
+    
+    # Log position status periodically
+    if loop_count % 120 == 1:  # Every 10 minutes
+        logger.debug("📊 Position %s: %s @ ₹%.2f | Current: ₹%.2f | P&L: ₹%.2f (%+.2f%%) | Status: %s",
+                     symbol, qty, avg_buy_price, ltp, current_pnl, pnl_percent, status)
+
+
+def process_position_tick(symbol: str, ltp: float, loop_count: int = 0):
+    """
+    Target / stop check for one symbol against its current DB row.
+    The fresh read keeps an alert already recorded this loop from firing twice.
+    """
+    row = get_conn().execute(
+        f"SELECT {EXIT_COLUMNS} FROM positions WHERE symbol = ?", (symbol,)
+    ).fetchone()
+    if row and row[3] not in ("TARGET_HIT", "SOLD"):
+        check_position_exits(symbol, ltp, row, loop_count)
+
+
 def monitor_loop():
     """Enhanced monitoring loop with better error handling and position tracking"""
     loop_count = 0
     
     # Previous close data will be fetched on-demand in the monitoring loop
-    print("🚀 Starting live trading monitor - previous close data will be fetched as needed")
+    logger.info("🚀 Starting live trading monitor - previous close data will be fetched as needed")
+    
+    feed = get_ticker_feed(KITE_API_KEY, KITE_ACCESS_TOKEN)
     
+    next_tick = time.monotonic()
     while True:
-        loop_count += 1
+        # A new interval starts once the deadline has been reached; an early wake from the feed keeps it.
+        # loop_count counts intervals only, so the "every N loops" cadences below stay tied to wall time
+        new_interval = time.monotonic() >= next_tick
+        if new_interval:
+            next_tick += POLL_INTERVAL
+            loop_count += 1
+        # Periodic work runs on the first pass of an interval, never again on a feed wake within it
+        every_5_min = new_interval and loop_count % 60 == 1
+        every_10_min = new_interval and loop_count % 120 == 1
+        if feed:
+            feed.wake.clear()
         current_time = datetime.now().strftime("%H:%M:%S")
         
         # Periodic status update
-        if loop_count % 60 == 1:  # Every 5 minutes (60 * 5 seconds)
-            print(f"🔄 [{current_time}] Monitor Loop #{loop_count} - Watching {len(MONITOR_STATE['symbols'])} symbols")
-            print(f"   Mode: {'DRY_RUN' if MONITOR_STATE['dry_run'] else 'LIVE TRADING'}")
-            print(f"   Bought today: {list(MONITOR_STATE['bought_today'])}")
+        if every_5_min:
+            logger.debug("🔄 [%s] Monitor Loop #%d - Watching %d symbols | Mode: %s | Bought today: %s",
+                         current_time, loop_count, len(MONITOR_STATE["symbols"]),
+                         "DRY_RUN" if MONITOR_STATE["dry_run"] else "LIVE TRADING", list(MONITOR_STATE["bought_today"]))
         
         # 🧹 Cleanup: Remove closed positions from bought_today protection
-        if loop_count % 120 == 1:  # Every 10 minutes
-            closed_symbols = []
-            with DB_LOCK:
-                cur = DB.cursor()
-                for symbol in list(MONITOR_STATE["bought_today"]):
-                    cur.execute("SELECT status FROM positions WHERE symbol = ? AND status IN ('TARGET_HIT', 'SOLD')", (symbol,))
-                    if cur.fetchone():
-                        closed_symbols.append(symbol)
+        if every_10_min:
+            bought_positions = load_positions_map(list(MONITOR_STATE["bought_today"]), "status")
+            closed_symbols = [s for s, (status,) in bought_positions.items() if status in ("TARGET_HIT", "SOLD")]
             
             for symbol in closed_symbols:
-                MONITOR_STATE["bought_today"].remove(symbol)
-                print(f"🧹 Cleanup: Removed {symbol} from bought_today (position closed)")
+                MONITOR_STATE["bought_today"].discard(symbol)
+                logger.info("🧹 Cleanup: Removed %s from bought_today (position closed)", symbol)
             
             # 🧹 Additional cleanup: Remove sold positions from database
             cleaned_count = cleanup_sold_positions()
@@ -1435,66 +2428,91 @@ def monitor_loop():
             pos_summary = get_position_summary()
             if pos_summary:
                 summary_text = ", ".join([f"{status}: {count}" for status, count in pos_summary.items()])
-                print(f"📊 Position Summary: {summary_text}")
+                logger.info("📊 Position Summary: %s", summary_text)
         
         symbols = MONITOR_STATE["symbols"]
         
-        for symbol in symbols:
+        # One read for every watchlist position instead of one query per symbol
+        positions = load_positions_map(symbols)
+        
+        # Symbols bought today with no open position left can't buy again and have nothing to exit,
+        # so they drop out of the price fetch; the set shrinks the fetch as the day progresses
+        bought_today = set(MONITOR_STATE["bought_today"])
+        active_symbols = [
+            s for s in symbols
+            if s not in bought_today or (s in positions and positions[s][3] not in ("TARGET_HIT", "SOLD"))
+        ]
+        
+        # Streamed LTPs while the websocket is up; REST only for symbols the feed can't cover yet
+        feed_ltps = {}
+        if feed:
+            feed.subscribe(resolve_instrument_tokens(symbols))
+            feed_ltps = feed.snapshot()
+        cached_levels = prev_close_levels(active_symbols)
+        rest_symbols = [s for s in active_symbols if s not in feed_ltps or s not in cached_levels]
+        
+        # One batched quote per tick supplies both LTP and previous close for every remaining symbol
+        failed_symbols = []
+        quotes = fetch_quotes_batch(rest_symbols, failed_symbols)
+        
+        ltps = {}
+        if failed_symbols and KITE and KITE.kite:
+            # Batch request failed for these - fetch LTPs and previous closes per symbol, overlapped on the
+            # shared pool; symbols a successful batch simply had no quote for are not retried
+            ltps = {s: ltp for s, ltp in EXEC.map(lambda s: (s, fetch_ltp(s)), failed_symbols) if ltp is not None}
+            fill_prev_closes(failed_symbols)
+        for symbol in active_symbols:
+            ltp = feed_ltps.get(symbol, quotes.get(symbol, {}).get("last_price"))
+            if ltp is not None:
+                ltps[symbol] = ltp
+        
+        # Columnar view of the watchlist: each condition is one array expression over all symbols
+        arr = build_monitor_arrays(symbols, ltps, positions)
+        MONITOR_STATE["arr"] = arr
+        
+        if feed:
+            # Only symbols without a position (and not bought today) can trigger a buy; only open positions have exit levels
+            for symbol, threshold, bought, is_open, target, loss_threshold in zip(
+                    symbols, arr["threshold"], arr["bought"], arr["open"], arr["target"], arr["loss_threshold"]):
+                no_buy = bought or symbol in bought_today or np.isnan(threshold)
+                feed.set_buy_threshold(symbol, None if no_buy else float(threshold))
+                feed.set_exit_levels(symbol, (float(target), float(loss_threshold)) if is_open else None)
+        
+        ltp = arr["ltp"]
+        buy_idx = np.flatnonzero(~arr["bought"] & (ltp <= arr["threshold"]))
+        held = arr["open"] & ~np.isnan(ltp)
+        if not every_10_min:  # every 10 minutes all open positions are visited for the status log
+            held &= (ltp >= arr["target"]) | (ltp <= arr["loss_threshold"])
+        
+        # Only the indices needing action enter the DB/order path
+        for i in np.concatenate((np.flatnonzero(held), buy_idx)):
+            symbol = symbols[i]
             try:
-                ltp = fetch_ltp(symbol)
-                if ltp is None:
-                    continue
-
-                # Check existing positions
-                with DB_LOCK:
-                    cur = DB.cursor()
-                    cur.execute("SELECT qty, avg_buy_price, target_price, status FROM positions WHERE symbol = ?", (symbol,))
-                    row = cur.fetchone()
-
-                if row:
-                    qty, avg_buy_price, target_price, status = row
-                    
-                    # Skip if position is already closed
-                    if status in ["TARGET_HIT", "SOLD"]:
-                        continue
-                    
-                    current_pnl = (ltp - avg_buy_price) * qty
-                    pnl_percent = ((ltp - avg_buy_price) / avg_buy_price) * 100 if avg_buy_price != 0 else 0
-                    
-                    # Check if target reached
-                    if ltp >= target_price and status not in ["TARGET_HIT"]:
-                        profit = (target_price - avg_buy_price) * qty
-                        notify(f"🎯 TARGET HIT! {symbol}: LTP ₹{ltp:.2f} >= Target ₹{target_price:.2f} | Profit: ₹{profit:.2f} (+{pnl_percent:.2f}%)")
-                        upsert_position(symbol, qty, avg_buy_price, datetime.now(timezone.utc).isoformat(), target_price, "TARGET_HIT")
-                        
-                        # 🔓 Remove from bought_today so it can be bought again if conditions are met
-                        if symbol in MONITOR_STATE["bought_today"]:
-                            MONITOR_STATE["bought_today"].remove(symbol)
-                            print(f"🔓 Removed {symbol} from bought_today protection - available for new trades")
-                    
-                    # Check stop loss alert (but don't auto-sell)
-                    loss_threshold = avg_buy_price * (1 - LOSS_ALERT_PERCENT / 100.0)
-                    if ltp <= loss_threshold and status not in ["ALERTED", "STOP_LOSS_HIT"]:
-                        loss = (ltp - avg_buy_price) * qty
-                        notify(f"🚨 STOP LOSS ALERT! {symbol}: LTP ₹{ltp:.2f} <= Threshold ₹{loss_threshold:.2f} | Loss: ₹{loss:.2f} ({pnl_percent:.2f}%)")
-                        notify(f"🚨 Consider selling {qty} shares of {symbol} manually!")
-                        upsert_position(symbol, qty, avg_buy_price, datetime.now(timezone.utc).isoformat(), target_price, "ALERTED")
-                    
-                    # Log position status periodically
-                    if loop_count % 120 == 1:  # Every 10 minutes
-                        print(f"📊 Position {symbol}: {qty} @ ₹{avg_buy_price:.2f} | Current: ₹{ltp:.2f} | P&L: ₹{current_pnl:.2f} ({pnl_percent:+.2f}%) | Status: {status}")
-                        
+                if symbol in positions:
+                    process_position_tick(symbol, float(ltp[i]), loop_count if new_interval else 0)
                 else:
-                    # No position - check for buy opportunities
-                    check_and_execute_buy(symbol, MONITOR_STATE["qty"], MONITOR_STATE["dry_run"])
+                    # No position and the gap-down condition holds - run the buy path
+                    check_and_execute_buy(symbol, MONITOR_STATE["qty"], MONITOR_STATE["dry_run"],
+                                          ltp=float(ltp[i]), prev_close=float(arr["prev"][i]))
 
             except Exception as e:
                 error_msg = f"❌ Monitor loop error for {symbol}: {e}"
-                print(error_msg)
-                if loop_count % 60 == 1:  # Don't spam errors
+                logger.error(error_msg)
+                if every_5_min:  # Don't spam errors
                     notify(f"Monitor error: {symbol} - {str(e)[:100]}")
         
-        time.sleep(POLL_INTERVAL)
+        # Deadline scheduling on the monotonic clock keeps a steady POLL_INTERVAL cadence however long
+        # the body took; after an overrun the next iteration starts immediately
+        now = time.monotonic()
+        if now >= next_tick:
+            logger.warning("⚠️ Monitor loop #%d overran its %ss interval by %.1fs", loop_count, POLL_INTERVAL, now - next_tick)
+            next_tick = now
+            continue
+        if feed:
+            # A tick crossing a buy threshold or an exit level ends the wait early; the deadline stays where it was
+            feed.wake.wait(next_tick - now)
+        else:
+            time.sleep(next_tick - now)
 
 
 # ---- GTT-Based Trading Strategy ----
@@ -1512,12 +2530,12 @@ def setup_gtt_strategy(symbol: str, prev_close: float, qty: int, dry_run: bool =
     
     # 🛡️ SINGLE ORDER CONSTRAINT: Check if symbol already has active position or pending GTT
     if has_active_position(symbol):
-        print(f"⏸️ Skipping {symbol}: Already has active position (BOUGHT status)")
+        logger.info("⏸️ Skipping %s: Already has active position (BOUGHT status)", symbol)
         notify(f"⏸️ {symbol}: Waiting for current position to sell before placing new GTT")
         return
     
     if has_pending_gtt(symbol):
-        print(f"⏸️ Skipping {symbol}: Already has pending GTT order")
+        logger.info("⏸️ Skipping %s: Already has pending GTT order", symbol)
         notify(f"⏸️ {symbol}: GTT order already active - no duplicate orders")
         return
     
@@ -1530,10 +2548,10 @@ def setup_gtt_strategy(symbol: str, prev_close: float, qty: int, dry_run: bool =
     
     try:
         if dry_run:
-            print(f"[DRY_RUN] 🎯 Would place GTT for {symbol}:")
-            print(f"   Buy when price <= ₹{buy_trigger_price:.2f} (Gap: {BUY_GAP_PERCENT}%)")
-            print(f"   Then target @ ₹{sell_target_price:.2f} (+{SELL_TARGET_PERCENT}%)")
-            print(f"   Stop loss @ ₹{stop_loss_price:.2f} (-{LOSS_ALERT_PERCENT}%)")
+            logger.info("[DRY_RUN] 🎯 Would place GTT for %s:", symbol)
+            logger.info("   Buy when price <= ₹%.2f (Gap: %s%%)", buy_trigger_price, BUY_GAP_PERCENT)
+            logger.info("   Then target @ ₹%.2f (+%s%%)", sell_target_price, SELL_TARGET_PERCENT)
+            logger.info("   Stop loss @ ₹%.2f (-%s%%)", stop_loss_price, LOSS_ALERT_PERCENT)
             
             # Save simulated GTT to database
             fake_gtt_id = f"DRYRUN-GTT-{symbol}-{datetime.now(timezone.utc).strftime('%Y%m%d-%H%M%S')}"
@@ -1557,7 +2575,7 @@ def setup_gtt_strategy(symbol: str, prev_close: float, qty: int, dry_run: bool =
         else:
             # Place real GTT order
             if KITE and KITE.kite:
-                print(f"🎯 Setting up GTT strategy for {symbol}")
+                logger.info("🎯 Setting up GTT strategy for %s", symbol)
                 
                 # Place buy GTT when price drops to trigger level
                 gtt_response = KITE.place_gtt(
@@ -1570,8 +2588,8 @@ def setup_gtt_strategy(symbol: str, prev_close: float, qty: int, dry_run: bool =
                 )
                 
                 gtt_id = gtt_response.get("trigger_id")
-                print(f"✅ GTT Buy order placed! ID: {gtt_id}")
-                print(f"   Trigger: ₹{buy_trigger_price:.2f} (Gap: {BUY_GAP_PERCENT}%)")
+                logger.info("✅ GTT Buy order placed! ID: %s", gtt_id)
+                logger.info("   Trigger: ₹%.2f (Gap: %s%%)", buy_trigger_price, BUY_GAP_PERCENT)
                 
                 notify(f"🎯 GTT Setup: {symbol} will BUY {qty} shares when price <= ₹{buy_trigger_price:.2f}")
                 
@@ -1579,7 +2597,7 @@ def setup_gtt_strategy(symbol: str, prev_close: float, qty: int, dry_run: bool =
                 raise RuntimeError("Kite API not available for GTT placement")
                 
     except Exception as e:
-        print(f"❌ Error setting up GTT for {symbol}: {e}")
+        logger.error("❌ Error setting up GTT for %s: %s", symbol, e)
         notify(f"❌ GTT Setup Failed: {symbol} - {str(e)}")
 
 def setup_gtt_for_watchlist(symbols: List[str], dry_run: bool = False):
@@ -1589,22 +2607,23 @@ def setup_gtt_for_watchlist(symbols: List[str], dry_run: bool = False):
     successful_gtts = 0
     failed_gtts = 0
     
-    print(f"🎯 Setting up GTT strategy for {len(symbols)} symbols...")
+    logger.info("🎯 Setting up GTT strategy for %s symbols...", len(symbols))
+    
+    # Prices and previous closes up front: one batched quote, concurrent fallback for the rest
+    quotes = fetch_quotes_batch(symbols)
+    fill_prev_closes(symbols)
     
     for symbol in symbols:
         try:
             # Get previous close
-            prev_close = MONITOR_STATE["last_prev_close"].get(symbol)
+            prev_close = get_prev_close(symbol)
             if prev_close is None:
-                prev_close = fetch_prev_close(symbol)
-                if prev_close is None:
-                    print(f"❌ Skipping {symbol}: No previous close data")
-                    failed_gtts += 1
-                    continue
-                MONITOR_STATE["last_prev_close"][symbol] = prev_close
+                logger.warning("❌ Skipping %s: No previous close data", symbol)
+                failed_gtts += 1
+                continue
             
             # Calculate quantity based on capital allocation
-            ltp = fetch_ltp(symbol)
+            ltp = quotes.get(symbol, {}).get("last_price") or fetch_ltp(symbol)
             if ltp and ltp > 0:
                 deployment_cap = MONITOR_STATE["total_capital"] * (MONITOR_STATE["deployment_percentage"] / 100.0)
                 per_trade_alloc = deployment_cap * (MONITOR_STATE["per_trade_percentage"] / 100.0)
@@ -1620,11 +2639,11 @@ def setup_gtt_for_watchlist(symbols: List[str], dry_run: bool = False):
             time.sleep(0.1)
             
         except Exception as e:
-            print(f"❌ Error setting up GTT for {symbol}: {e}")
+            logger.error("❌ Error setting up GTT for %s: %s", symbol, e)
             failed_gtts += 1
             continue
     
-    print(f"✅ GTT Setup Complete: {successful_gtts} successful, {failed_gtts} failed")
+    logger.info("✅ GTT Setup Complete: %s successful, %s failed", successful_gtts, failed_gtts)
     notify(f"🎯 GTT Strategy Active: {successful_gtts} ETFs monitoring for gap-down opportunities")
 
 def monitor_gtt_executions():
@@ -1649,7 +2668,7 @@ def monitor_gtt_executions():
                 update_gtt_status(gtt_id, "TRIGGERED")
                 
                 # Check if we need to place sell GTT
-                print(f"🎉 GTT Buy triggered for {symbol}! Setting up sell target...")
+                logger.info("🎉 GTT Buy triggered for %s! Setting up sell target...", symbol)
                 
                 # Get the executed order details to determine target price
                 order = gtt.get("orders", [{}])[0]
@@ -1673,14 +2692,14 @@ def monitor_gtt_executions():
                             condition=">="
                         )
                         
-                        print(f"✅ Sell target GTT placed for {symbol} @ ₹{target_price:.2f}")
+                        logger.info("✅ Sell target GTT placed for %s @ ₹%.2f", symbol, target_price)
                         notify(f"🎯 Target Set: {symbol} will sell at ₹{target_price:.2f} (+{SELL_TARGET_PERCENT}%)")
                         
                     except Exception as e:
-                        print(f"❌ Error placing sell GTT for {symbol}: {e}")
+                        logger.error("❌ Error placing sell GTT for %s: %s", symbol, e)
                 
     except Exception as e:
-        print(f"❌ Error monitoring GTT executions: {e}")
+        logger.error("❌ Error monitoring GTT executions: %s", e)
 
 
 # ---- Streamlit UI ----
@@ -1713,8 +2732,6 @@ with col2:
 with col3:
     # Show session indicator - use a simpler method to detect access type
     try:
-        # Try to get the current URL from browser
-        import urllib.parse
         # Simple detection based on common patterns
         access_method = "Network"  # Default assumption for cloud/network access
         st.info(f"📡 {access_method} Access")
@@ -1843,28 +2860,37 @@ KITE_API_SECRET=your_api_secret_here""")
                         status_text.text("🔄 Updating configuration...")
                         progress_bar.progress(60)
                         
-                        # Update .env file
-                        env_lines = []
-                        token_updated = False
-                        
+                        # Update .env file: one regex pass, then an atomic swap so an interrupted
+                        # write can never leave a truncated .env behind
                         try:
                             with open('.env', 'r') as file:
-                                env_lines = file.readlines()
+                                env_content = file.read()
                         except FileNotFoundError:
-                            env_lines = []
+                            env_content = ""
                         
-                        # Update or add the access token
-                        with open('.env', 'w') as file:
-                            for line in env_lines:
-                                if line.startswith('KITE_ACCESS_TOKEN='):
-                                    file.write(f'KITE_ACCESS_TOKEN={access_token}\n')
-                                    token_updated = True
-                                else:
-                                    file.write(line)
-                            
-                            # Add token if not found in existing file
-                            if not token_updated:
-                                file.write(f'KITE_ACCESS_TOKEN={access_token}\n')
+                        token_line = f'KITE_ACCESS_TOKEN={access_token}'
+                        env_content, token_updated = re.subn(
+                            r'^KITE_ACCESS_TOKEN=.*$', lambda _: token_line, env_content, flags=re.M
+                        )
+                        # Add token if not found in existing file
+                        if not token_updated:
+                            if env_content and not env_content.endswith('\n'):
+                                env_content += '\n'
+                            env_content += token_line + '\n'
+                        
+                        # .env holds secrets: the replacement keeps the original permissions (0600 for a
+                        # new file) and is flushed to disk before the swap so a crash can't leave it empty
+                        try:
+                            env_mode = os.stat('.env').st_mode & 0o777
+                        except FileNotFoundError:
+                            env_mode = 0o600
+                        fd = os.open('.env.tmp', os.O_WRONLY | os.O_CREAT | os.O_TRUNC, env_mode)
+                        with os.fdopen(fd, 'w') as file:
+                            os.fchmod(fd, env_mode)  # os.open's mode is reduced by the umask
+                            file.write(env_content)
+                            file.flush()
+                            os.fsync(fd)
+                        os.replace('.env.tmp', '.env')
                         
                         status_text.text("🔄 Verifying connection...")
                         progress_bar.progress(80)
@@ -1941,6 +2967,10 @@ KITE_API_SECRET=your_api_secret_here""")
 
 st.markdown("---")
 
+# One batched quote for the whole watchlist per render, shared by the sidebar examples and the main table
+quoted_symbols = MONITOR_STATE["symbols"]
+watchlist_quotes = fetch_quotes_batch(quoted_symbols)
+
 # Left controls
 with st.sidebar:
     st.header("⚙️ Trading Settings")
@@ -1990,7 +3020,7 @@ with st.sidebar:
             kite_conn = get_kite_connection()
             if kite_conn and kite_conn.kite:
                 try:
-                    margins = kite_conn.kite.margins()
+                    margins = kite_conn.get_margins()
                     available_cash = margins.get('equity', {}).get('available', {}).get('cash', 0)
                     st.metric("💰 Available Cash", f"₹{available_cash:,.2f}")
                 except Exception as e:
@@ -2008,8 +3038,9 @@ with st.sidebar:
                         profile = kite_conn.kite.profile()
                         st.success(f"✅ Connected as: {profile.get('user_name', 'Unknown')}")
                         
-                        # Then fetch margins
-                        margins = kite_conn.kite.margins()
+                        # Then fetch margins, bypassing the cache on an explicit refresh
+                        kite_conn.invalidate_margins()
+                        margins = kite_conn.get_margins()
                         equity_data = margins.get('equity', {})
                         available_data = equity_data.get('available', {})
                         cash = available_data.get('cash', 0)
@@ -2075,6 +3106,7 @@ with st.sidebar:
         kite_conn = get_kite_connection()
         if kite_conn and kite_conn.kite:
             with st.spinner("Fetching account balance..."):
+                kite_conn.invalidate_margins()
                 update_capital_allocation()
                 st.rerun()
         else:
@@ -2151,7 +3183,7 @@ with st.sidebar:
             sample_symbols = MONITOR_STATE["symbols"][:10]  # Show first 10 ETFs
             
             for sym in sample_symbols:
-                ltp = fetch_ltp(sym)
+                ltp = watchlist_quotes.get(sym, {}).get("last_price")
                 if ltp and ltp > 0:
                     # Calculate exact quantity and allocation for this ETF
                     quantity = int(per_trade_allocation / ltp)
@@ -2168,7 +3200,6 @@ with st.sidebar:
             
             if sample_data:
                 # Display as a nice table
-                import pandas as pd
                 df = pd.DataFrame(sample_data)
                 st.dataframe(df, use_container_width=True, hide_index=True)
                 
@@ -2243,7 +3274,7 @@ with st.sidebar:
         st.write("**Sample calculations for current prices:**")
         sample_symbols = MONITOR_STATE["symbols"][:3]  # Show first 3 symbols
         for sym in sample_symbols:
-            ltp = fetch_ltp(sym)
+            ltp = watchlist_quotes.get(sym, {}).get("last_price")
             if ltp and ltp > 0:
                 deployment_cap = MONITOR_STATE["total_capital"] * (MONITOR_STATE["deployment_percentage"] / 100.0)
                 per_trade_alloc = deployment_cap * (MONITOR_STATE["per_trade_percentage"] / 100.0)
@@ -2322,16 +3353,13 @@ with st.sidebar:
                 if symbol:
                     symbols.append(symbol)
             
-            MONITOR_STATE["symbols"] = symbols
+            set_watchlist(symbols)
             # Don't reset bought_today when updating watchlist - it should persist throughout the trading day
             
             # Initialize previous close data for new symbols
             if KITE and KITE.kite:
-                for symbol in symbols:
-                    if symbol not in MONITOR_STATE["last_prev_close"]:
-                        prev_close = fetch_prev_close(symbol)
-                        if prev_close:
-                            MONITOR_STATE["last_prev_close"][symbol] = prev_close
+                fetch_quotes_batch(symbols)
+                fill_prev_closes(symbols)
             
             st.success(f"Updated watchlist: {len(symbols)} symbols")
             st.rerun()
@@ -2342,15 +3370,12 @@ with st.sidebar:
                 # Clear cache and fetch fresh ETF list
                 _cached_etf_instruments.clear()
                 symbols = fetch_etf_instruments(KITE.kite)
-                MONITOR_STATE["symbols"] = symbols
+                set_watchlist(symbols)
                 
                 # Initialize previous close data for new symbols
                 st.info("🔄 Initializing previous close data for new symbols...")
-                for symbol in symbols[:20]:  # Initialize first 20 to avoid timeout
-                    if symbol not in MONITOR_STATE["last_prev_close"]:
-                        prev_close = fetch_prev_close(symbol)
-                        if prev_close:
-                            MONITOR_STATE["last_prev_close"][symbol] = prev_close
+                fetch_quotes_batch(symbols)
+                fill_prev_closes(symbols)
                 
                 st.success(f"✅ Fetched {len(symbols)} ETFs from instruments API")
                 st.rerun()
@@ -2360,7 +3385,7 @@ with st.sidebar:
     with col3:
         if st.button("📋 Load from ENV"):
             env_symbols = get_watchlist_from_env_or_instruments(None)
-            MONITOR_STATE["symbols"] = env_symbols
+            set_watchlist(env_symbols)
             st.success(f"✅ Loaded {len(env_symbols)} symbols from environment")
             st.rerun()
 
@@ -2437,74 +3462,56 @@ if "monitor_thread_started" not in st.session_state:
 
 # Main table: positions + live LTP
 symbols = MONITOR_STATE["symbols"]
-rows = []
-import time
-
-for i, sym in enumerate(symbols):
-    # Fetch previous close if not cached
-    prev_close = MONITOR_STATE["last_prev_close"].get(sym)
-    if prev_close is None:
-        prev_close = fetch_prev_close(sym)
-        if prev_close:
-            MONITOR_STATE["last_prev_close"][sym] = prev_close
-    
-    # Fetch current LTP
-    ltp = fetch_ltp(sym)
-    
-    # Debug info (can be removed later)
-    if prev_close is None:
-        print(f"⚠️ No previous close for {sym}")
-    if ltp is None:
-        print(f"⚠️ No LTP for {sym}")
-    
-    # status from DB
-    with DB_LOCK:
-        cur = DB.cursor()
-        cur.execute("SELECT qty, avg_buy_price, target_price, status, product FROM positions WHERE symbol = ?", (sym,))
-        row = cur.fetchone()
-    if row:
-        qty_db, avg_buy, target, status, product = row
-        unreal = (ltp - avg_buy) * qty_db if isinstance(ltp, (int, float)) else None
-    else:
-        qty_db, avg_buy, target, status, product, unreal = 0, None, None, "WATCHING", "CNC", None
 
-    pct_vs_prev = None
-    # Zero-safe division to prevent ZeroDivisionError
-    if isinstance(prev_close, (int, float)) and isinstance(ltp, (int, float)) and prev_close != 0 and prev_close is not None:
-        try:
-            pct_vs_prev = (ltp - prev_close) / prev_close * 100.0
-        except (ZeroDivisionError, TypeError):
-            pct_vs_prev = None
-    
-    # Calculate allocation information for this ETF
-    allocation_qty = "-"
-    allocation_amount = "-"
-    if isinstance(ltp, (int, float)) and ltp > 0 and MONITOR_STATE["total_capital"] > 0:
-        deployment_capital = MONITOR_STATE["total_capital"] * (MONITOR_STATE["deployment_percentage"] / 100.0)
-        per_trade_allocation = deployment_capital * (MONITOR_STATE["per_trade_percentage"] / 100.0)
-        calculated_qty = int(per_trade_allocation / ltp)
-        actual_allocation = calculated_qty * ltp
-        allocation_qty = f"{calculated_qty:,}"
-        allocation_amount = f"₹{actual_allocation:,.0f}"
-    
-    rows.append({
-        "symbol": sym,
-        "prev_close": f"₹{prev_close:.2f}" if isinstance(prev_close, (int, float)) else "-",
-        "ltp": f"₹{ltp:.2f}" if isinstance(ltp, (int, float)) else "-",
-        "% vs prev_close": f"{pct_vs_prev:.2f}%" if pct_vs_prev is not None else "-",
-        "allocation_qty": allocation_qty,
-        "allocation_amount": allocation_amount,
-        "position_qty": qty_db,
-        "avg_buy": f"₹{avg_buy:.2f}" if avg_buy is not None else "-",
-        "target_price": f"₹{target:.2f}" if target is not None else "-",
-        "unrealized_pnl": f"₹{unreal:.2f}" if unreal is not None else "-",
-        "product": product if product else "CNC",
-        "status": status,
-    })
-    
-    # Small delay to avoid rate limits when fetching data for multiple symbols
-    if i > 0 and i % 3 == 0:
-        time.sleep(0.5)
+if symbols is not quoted_symbols:
+    # The sidebar replaced the watchlist during this run - quote the new one (reused by the market data table below)
+    watchlist_quotes = fetch_quotes_batch(symbols)
+
+# Previous closes: cached for the trading day (seeded by the batch above); fetch only the gaps
+watchlist_levels = fill_prev_closes(symbols)
+
+# Position rows for the whole watchlist in one query
+watchlist_positions = load_watchlist_positions(tuple(symbols))
+
+# Build the table column-wise; values stay numeric and are formatted by column_config at render time
+ltp_arr = np.array([watchlist_quotes.get(s, {}).get("last_price", np.nan) for s in symbols], dtype=np.float64)
+prev_arr = np.array([watchlist_levels.get(s, (np.nan,))[0] for s in symbols], dtype=np.float64)
+positions_df = pd.DataFrame(
+    [(s, *row) for s, row in watchlist_positions.items()],
+    columns=["symbol", "position_qty", "avg_buy", "target_price", "status", "product"],
+)
+df = pd.DataFrame({"symbol": symbols, "ltp": ltp_arr, "prev_close": prev_arr}).merge(positions_df, on="symbol", how="left")
+has_position = df["status"].notna().to_numpy()
+df["position_qty"] = df["position_qty"].fillna(0).astype(int)
+df[["avg_buy", "target_price"]] = df[["avg_buy", "target_price"]].astype(np.float64)
+df["status"] = df["status"].fillna("WATCHING")
+df["product"] = df["product"].fillna("CNC")
+
+pct_arr, unreal_arr = compute_metrics(
+    ltp_arr, prev_arr, df["position_qty"].to_numpy(dtype=np.float64), df["avg_buy"].to_numpy(dtype=np.float64)
+)
+df["% vs prev_close"] = pct_arr
+df["unrealized_pnl"] = np.where(has_position, unreal_arr, np.nan)
+
+# Allocation information for every ETF at once
+df["allocation_qty"] = np.nan
+df["allocation_amount"] = np.nan
+if MONITOR_STATE["total_capital"] > 0:
+    deployment_capital = MONITOR_STATE["total_capital"] * (MONITOR_STATE["deployment_percentage"] / 100.0)
+    per_trade_allocation = deployment_capital * (MONITOR_STATE["per_trade_percentage"] / 100.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        allocation_qty = np.where(ltp_arr > 0, np.floor(per_trade_allocation / ltp_arr), np.nan)
+    df["allocation_qty"] = allocation_qty
+    df["allocation_amount"] = allocation_qty * ltp_arr
+
+# Debug info: the miss lists are only built when DEBUG logging is on
+if logger.isEnabledFor(logging.DEBUG):
+    missing_prev = [s for s, v in zip(symbols, prev_arr) if np.isnan(v)]
+    missing_ltp = [s for s, v in zip(symbols, ltp_arr) if np.isnan(v)]
+    if missing_prev:
+        logger.debug("⚠️ No previous close for %s", ", ".join(missing_prev))
+    if missing_ltp:
+        logger.debug("⚠️ No LTP for %s", ", ".join(missing_ltp))
 
 # Main content tabs
 tab1, tab2, tab3 = st.tabs(["📊 Watchlist & Positions", "🎯 GTT Management", "📈 Trading Activity"])
@@ -2516,18 +3523,17 @@ with tab1:
     col1, col2 = st.columns([1, 4])
     with col1:
         if st.button("🔄 Refresh Data"):
-            # Clear cached data to force refresh
-            MONITOR_STATE["last_prev_close"].clear()
+            # Previous close is fixed for the day - only entries from earlier days need refetching
+            prune_prev_close_cache()
             st.rerun()
 
     # Show data status
-    if any(isinstance(MONITOR_STATE["last_prev_close"].get(sym), (int, float)) for sym in symbols):
-        st.success(f"✅ Data loaded for {len([s for s in symbols if MONITOR_STATE['last_prev_close'].get(s)])} symbols")
+    loaded_levels = prev_close_levels(symbols)
+    if loaded_levels:
+        st.success(f"✅ Data loaded for {len(loaded_levels)} symbols")
     else:
         st.warning("⏳ Loading market data... Click 'Refresh Data' if data doesn't appear")
 
-    df = pd.DataFrame(rows)
-    
     # Reorder columns to prioritize allocation information
     column_order = [
         'symbol', 'ltp', '% vs prev_close', 'allocation_qty', 'allocation_amount',
@@ -2541,17 +3547,17 @@ with tab1:
     # Configure column display with better names
     column_config = {
         'symbol': st.column_config.TextColumn('ETF Symbol', width='small'),
-        'ltp': st.column_config.TextColumn('Current Price', width='small'),
-        '% vs prev_close': st.column_config.TextColumn('Gap %', width='small'),
-        'allocation_qty': st.column_config.TextColumn('📊 Buy Qty', width='small', help='Quantity to buy based on allocation'),
-        'allocation_amount': st.column_config.TextColumn('💰 Buy Amount', width='medium', help='Total amount that will be invested'),
+        'ltp': st.column_config.NumberColumn('Current Price', width='small', format='₹%.2f'),
+        '% vs prev_close': st.column_config.NumberColumn('Gap %', width='small', format='%.2f%%'),
+        'allocation_qty': st.column_config.NumberColumn('📊 Buy Qty', width='small', format='%d', help='Quantity to buy based on allocation'),
+        'allocation_amount': st.column_config.NumberColumn('💰 Buy Amount', width='medium', format='₹%.0f', help='Total amount that will be invested'),
         'position_qty': st.column_config.NumberColumn('Holdings', width='small'),
-        'avg_buy': st.column_config.TextColumn('Buy Price', width='small'),
-        'unrealized_pnl': st.column_config.TextColumn('P&L', width='small'),
-        'target_price': st.column_config.TextColumn('Target', width='small'),
+        'avg_buy': st.column_config.NumberColumn('Buy Price', width='small', format='₹%.2f'),
+        'unrealized_pnl': st.column_config.NumberColumn('P&L', width='small', format='₹%.2f'),
+        'target_price': st.column_config.NumberColumn('Target', width='small', format='₹%.2f'),
         'status': st.column_config.TextColumn('Status', width='medium'),
         'product': st.column_config.TextColumn('Type', width='small'),
-        'prev_close': st.column_config.TextColumn('Prev Close', width='small')
+        'prev_close': st.column_config.NumberColumn('Prev Close', width='small', format='₹%.2f')
     }
     
     # Display allocation summary above the table
@@ -2569,7 +3575,10 @@ with tab1:
         height=600
     )
 
-with tab2:
+
+@fragment
+def render_gtt_management():
+    # GTT actions and the manual GTT form rerun only this tab
     st.subheader("🎯 GTT (Good Till Triggered) Orders")
     
     # GTT Overview
@@ -2599,12 +3608,12 @@ with tab2:
         display_gtts = active_gtts_df.copy()
         if 'created_at' in display_gtts.columns:
             display_gtts['created_at'] = pd.to_datetime(display_gtts['created_at']).dt.strftime('%Y-%m-%d %H:%M')
-        if 'trigger_price' in display_gtts.columns:
-            display_gtts['trigger_price'] = display_gtts['trigger_price'].apply(lambda x: f"₹{x:.2f}")
-        if 'price' in display_gtts.columns:
-            display_gtts['price'] = display_gtts['price'].apply(lambda x: f"₹{x:.2f}" if pd.notna(x) and x > 0 else "-")
         
-        st.dataframe(display_gtts[['symbol', 'trigger_price', 'condition', 'order_type', 'quantity', 'status', 'created_at']], width='stretch')
+        st.dataframe(
+            display_gtts[['symbol', 'trigger_price', 'condition', 'order_type', 'quantity', 'status', 'created_at']],
+            width='stretch',
+            column_config={'trigger_price': st.column_config.NumberColumn(format='₹%.2f')},
+        )
         
         # GTT Actions
         st.subheader("🎛️ GTT Actions")
@@ -2701,183 +3710,191 @@ with tab2:
             else:
                 st.error("❌ Please fill in all required fields")
 
+
+with tab2:
+    render_gtt_management()
+
 with tab3:
     # Activity log (last 50 trades)
     st.subheader("📈 Recent Trading Activity")
-with DB_LOCK:
-    trades_df = pd.read_sql_query("SELECT * FROM trades ORDER BY id DESC LIMIT 50", DB)
+trades_df = load_recent_trades_df(50)
 st.subheader("Recent activity")
 st.dataframe(trades_df, width='stretch')
 
 # Manual actions
-st.subheader("🎮 Manual Trading Actions")
-
-# Safety check for manual trades
-if not MONITOR_STATE["dry_run"] and (not KITE or not KITE.kite):
-    st.error("❌ Manual trading disabled: Kite API not connected")
-else:
-    col1, col2 = st.columns(2)
+@fragment
+def render_manual_actions():
+    # Symbol pickers and order forms rerun only this panel
+    st.subheader("🎮 Manual Trading Actions")
+
+    # Safety check for manual trades
+    if not MONITOR_STATE["dry_run"] and (not KITE or not KITE.kite):
+        st.error("❌ Manual trading disabled: Kite API not connected")
+    else:
+        col1, col2 = st.columns(2)
     
-    with col1:
-        st.write("### 🛒 Manual BUY")
-        symbol_manual = st.text_input("Symbol (NSE tradingsymbol)", value="", key="manual_buy_symbol")
-        qty_manual = st.number_input("Quantity", value=MONITOR_STATE["qty"], min_value=1, key="manual_qty")
-        
-        # Show current quote if available
-        if symbol_manual and KITE:
-            quote = KITE.quote(symbol_manual)
-            if quote:
-                ltp = quote.get('last_price', 0)
-                st.info(f"Current LTP: ₹{ltp:.2f}")
-                estimated_cost = ltp * qty_manual
-                st.info(f"Estimated Cost: ₹{estimated_cost:,.2f}")
-        
-        buy_button_text = "🛡️ Simulate BUY" if MONITOR_STATE["dry_run"] else "🚀 PLACE BUY ORDER"
-        
-        if st.button(buy_button_text, type="primary"):
-            if not symbol_manual:
-                st.error("Enter a symbol")
-            elif has_active_position(symbol_manual):
-                st.error(f"❌ {symbol_manual} already has an active position! Wait for it to sell before buying again.")
-            elif has_pending_gtt(symbol_manual):
-                st.error(f"❌ {symbol_manual} already has a pending GTT order! Cancel it first or wait for execution.")
-            elif symbol_manual in MONITOR_STATE["bought_today"]:
-                st.error(f"❌ Already bought {symbol_manual} today! Only one order per symbol per day is allowed.")
-            else:
-                if MONITOR_STATE["dry_run"]:
-                    # Get current LTP for simulation
-                    ltp = 0.0
-                    if KITE:
-                        quote = KITE.quote(symbol_manual)
-                        if quote:
-                            ltp = quote.get('last_price', 0)
+        with col1:
+            st.write("### 🛒 Manual BUY")
+            symbol_manual = st.text_input("Symbol (NSE tradingsymbol)", value="", key="manual_buy_symbol")
+            qty_manual = st.number_input("Quantity", value=MONITOR_STATE["qty"], min_value=1, key="manual_qty")
+        
+            # Show current quote if available
+            if symbol_manual and KITE:
+                quote = KITE.quote(symbol_manual)
+                if quote:
+                    ltp = quote.get('last_price', 0)
+                    st.info(f"Current LTP: ₹{ltp:.2f}")
+                    estimated_cost = ltp * qty_manual
+                    st.info(f"Estimated Cost: ₹{estimated_cost:,.2f}")
+        
+            buy_button_text = "🛡️ Simulate BUY" if MONITOR_STATE["dry_run"] else "🚀 PLACE BUY ORDER"
+        
+            if st.button(buy_button_text, type="primary"):
+                buy_allowed, block_reason = can_buy(symbol_manual) if symbol_manual else (False, "")
+                if not symbol_manual:
+                    st.error("Enter a symbol")
+                elif not buy_allowed:
+                    st.error(f"❌ {block_reason}")
+                else:
+                    if MONITOR_STATE["dry_run"]:
+                        # Get current LTP for simulation
+                        ltp = 0.0
+                        if KITE:
+                            quote = KITE.quote(symbol_manual)
+                            if quote:
+                                ltp = quote.get('last_price', 0)
                     
-                    save_trade(symbol_manual, int(qty_manual), "BUY", ltp, "DRYRUN-MANUAL", True, {
-                        "note": "manual dryrun buy",
-                        "estimated_cost": ltp * qty_manual
-                    })
+                        save_trade(symbol_manual, int(qty_manual), "BUY", ltp, "DRYRUN-MANUAL", True, {
+                            "note": "manual dryrun buy",
+                            "estimated_cost": ltp * qty_manual
+                        })
                     
-                    # Mark as bought today to prevent multiple orders
-                    MONITOR_STATE["bought_today"].add(symbol_manual)
+                        # Mark as bought today to prevent multiple orders
+                        MONITOR_STATE["bought_today"].add(symbol_manual)
                     
-                    st.success(f"🛡️ [DRY_RUN] Buy simulated: {qty_manual} x {symbol_manual} @ ₹{ltp:.2f}")
-                else:
-                    try:
-                        with st.spinner("Placing buy order..."):
-                            resp = KITE.place_market_buy(symbol_manual, int(qty_manual))
-                            order_id = resp.get("order_id") if isinstance(resp, dict) else str(resp)
-                            product_used = resp.get("product_used", "CNC")  # Get the product type used
+                        st.success(f"🛡️ [DRY_RUN] Buy simulated: {qty_manual} x {symbol_manual} @ ₹{ltp:.2f}")
+                    else:
+                        try:
+                            with st.spinner("Placing buy order..."):
+                                resp = KITE.place_market_buy(symbol_manual, int(qty_manual))
+                                order_id = resp.get("order_id") if isinstance(resp, dict) else str(resp)
+                                product_used = resp.get("product_used", "CNC")  # Get the product type used
                             
-                            # Wait and verify execution
-                            time.sleep(2)
-                            execution = verify_order_execution(order_id, symbol_manual)
+                                # Wait and verify execution
+                                execution = wait_for_order_execution(order_id, symbol_manual)
                             
-                            if execution and execution.get('status') == 'COMPLETE':
-                                avg_price = execution['average_price']
-                                filled_qty = execution['filled_quantity']
-                                total_cost = avg_price * filled_qty
+                                if execution and execution.get('status') == 'COMPLETE':
+                                    avg_price = execution['average_price']
+                                    filled_qty = execution['filled_quantity']
+                                    total_cost = avg_price * filled_qty
                                 
-                                save_trade(symbol_manual, filled_qty, "BUY", avg_price, order_id, False, {
-                                    "kite_resp": resp,
-                                    "execution_details": execution,
-                                    "product_used": product_used
-                                })
+                                    fill_ts = datetime.now(timezone.utc).isoformat()
+                                    save_trade(symbol_manual, filled_qty, "BUY", avg_price, order_id, False, {
+                                        "kite_resp": resp,
+                                        "execution_details": execution,
+                                        "product_used": product_used
+                                    }, timestamp=fill_ts)
                                 
-                                st.success(f"✅ BUY EXECUTED: {filled_qty} x {symbol_manual} @ ₹{avg_price:.2f} ({product_used})")
-                                st.info(f"Total Cost: ₹{total_cost:,.2f} | Order ID: {order_id}")
+                                    st.success(f"✅ BUY EXECUTED: {filled_qty} x {symbol_manual} @ ₹{avg_price:.2f} ({product_used})")
+                                    st.info(f"Total Cost: ₹{total_cost:,.2f} | Order ID: {order_id}")
                                 
-                                # Auto-create position entry with correct product type
-                                target = avg_price * (1 + SELL_TARGET_PERCENT / 100.0)
-                                upsert_position(symbol_manual, filled_qty, avg_price, datetime.now(timezone.utc).isoformat(), target, "BOUGHT", product_used)
+                                    # Auto-create position entry with correct product type
+                                    target = avg_price * (1 + SELL_TARGET_PERCENT / 100.0)
+                                    upsert_position(symbol_manual, filled_qty, avg_price, fill_ts, target, "BOUGHT", product_used)
                                 
-                                # Mark as bought today to prevent multiple orders
-                                MONITOR_STATE["bought_today"].add(symbol_manual)
+                                    # Mark as bought today to prevent multiple orders
+                                    MONITOR_STATE["bought_today"].add(symbol_manual)
                                 
-                            else:
-                                save_trade(symbol_manual, int(qty_manual), "BUY_PENDING", 0.0, order_id, False, {
-                                    "kite_resp": resp,
-                                    "execution_details": execution
-                                })
-                                st.warning(f"⏳ Order placed but pending: {order_id}")
+                                else:
+                                    save_trade(symbol_manual, int(qty_manual), "BUY_PENDING", 0.0, order_id, False, {
+                                        "kite_resp": resp,
+                                        "execution_details": execution
+                                    })
+                                    st.warning(f"⏳ Order placed but pending: {order_id}")
                                 
-                    except Exception as e:
-                        st.error(f"❌ Buy order failed: {str(e)}")
-                        save_trade(symbol_manual, int(qty_manual), "BUY_FAILED", 0.0, "", False, {"error": str(e)})
+                        except Exception as e:
+                            st.error(f"❌ Buy order failed: {str(e)}")
+                            save_trade(symbol_manual, int(qty_manual), "BUY_FAILED", 0.0, "", False, {"error": str(e)})
+                    
+                    # Commit this order's trade rows before the panel finishes rendering
+                    flush_trades()
 
-    with col2:
-        st.write("### 📤 Manual SELL")
-        symbol_sell = st.text_input("Symbol to sell", value="", key="manual_sell_symbol")
-        
-        # Auto-populate from positions
-        positions_df = load_positions_df()
-        if not positions_df.empty:
-            available_positions = positions_df[positions_df['qty'] > 0]['symbol'].tolist()
-            if available_positions:
-                symbol_sell = st.selectbox("Or select from positions:", [""] + available_positions, key="position_select")
-        
-        qty_sell = st.number_input("Quantity to sell", value=0, min_value=0, key="manual_sell_qty")
-        
-        # Order type selection
-        sell_type = st.radio("Order Type:", ["Market", "Limit"], key="sell_type")
-        price_sell = 0.0
-        
-        if sell_type == "Limit":
-            price_sell = st.number_input("Limit price", value=0.0, format="%.2f", key="limit_price")
-            if symbol_sell and KITE:
-                quote = KITE.quote(symbol_sell)
-                if quote:
-                    ltp = quote.get('last_price', 0)
-                    st.info(f"Current LTP: ₹{ltp:.2f}")
+        with col2:
+            st.write("### 📤 Manual SELL")
+            symbol_sell = st.text_input("Symbol to sell", value="", key="manual_sell_symbol")
+        
+            # Auto-populate from positions
+            held_positions = {row['symbol']: row for row in load_positions_rows(held_only=True)}
+            if held_positions:
+                symbol_sell = st.selectbox("Or select from positions:", [""] + list(held_positions), key="position_select")
         
-        # Show position details if available
-        if symbol_sell and not positions_df.empty:
-            pos_data = positions_df[positions_df['symbol'] == symbol_sell]
-            if not pos_data.empty:
-                pos = pos_data.iloc[0]
+            qty_sell = st.number_input("Quantity to sell", value=0, min_value=0, key="manual_sell_qty")
+        
+            # Order type selection
+            sell_type = st.radio("Order Type:", ["Market", "Limit"], key="sell_type")
+            price_sell = 0.0
+        
+            if sell_type == "Limit":
+                price_sell = st.number_input("Limit price", value=0.0, format="%.2f", key="limit_price")
+                if symbol_sell and KITE:
+                    quote = KITE.quote(symbol_sell)
+                    if quote:
+                        ltp = quote.get('last_price', 0)
+                        st.info(f"Current LTP: ₹{ltp:.2f}")
+        
+            # Show position details if available
+            if symbol_sell in held_positions:
+                pos = held_positions[symbol_sell]
                 st.info(f"Position: {pos['qty']} shares @ ₹{pos['avg_buy_price']:.2f}")
                 if qty_sell > pos['qty']:
                     st.error(f"Cannot sell {qty_sell} - only {pos['qty']} available")
 
-        sell_button_text = "🛡️ Simulate SELL" if MONITOR_STATE["dry_run"] else f"🚀 PLACE {sell_type.upper()} SELL"
+            sell_button_text = "🛡️ Simulate SELL" if MONITOR_STATE["dry_run"] else f"🚀 PLACE {sell_type.upper()} SELL"
         
-        if st.button(sell_button_text, type="secondary"):
-            if not symbol_sell:
-                st.error("Enter symbol to sell")
-            elif qty_sell <= 0:
-                st.error("Enter quantity > 0")
-            else:
-                if MONITOR_STATE["dry_run"]:
-                    # Simulate sell
-                    ltp = price_sell if sell_type == "Limit" else 0.0
-                    if ltp == 0.0 and KITE:
-                        quote = KITE.quote(symbol_sell)
-                        if quote:
-                            ltp = quote.get('last_price', 0)
-                    
-                    save_trade(symbol_sell, int(qty_sell), "SELL", ltp, "DRYRUN-MANUAL-SELL", True, {
-                        "note": f"manual dryrun {sell_type.lower()} sell",
-                        "order_type": sell_type.lower()
-                    })
-                    st.success(f"🛡️ [DRY_RUN] {sell_type} sell simulated: {qty_sell} x {symbol_sell}")
+            if st.button(sell_button_text, type="secondary"):
+                if not symbol_sell:
+                    st.error("Enter symbol to sell")
+                elif qty_sell <= 0:
+                    st.error("Enter quantity > 0")
                 else:
-                    try:
-                        with st.spinner(f"Placing {sell_type.lower()} sell order..."):
-                            if sell_type == "Limit":
-                                resp = KITE.place_limit_sell(symbol_sell, int(qty_sell), float(price_sell))
-                            else:
-                                resp = KITE.place_market_sell(symbol_sell, int(qty_sell))
+                    if MONITOR_STATE["dry_run"]:
+                        # Simulate sell
+                        ltp = price_sell if sell_type == "Limit" else 0.0
+                        if ltp == 0.0 and KITE:
+                            quote = KITE.quote(symbol_sell)
+                            if quote:
+                                ltp = quote.get('last_price', 0)
+                    
+                        save_trade(symbol_sell, int(qty_sell), "SELL", ltp, "DRYRUN-MANUAL-SELL", True, {
+                            "note": f"manual dryrun {sell_type.lower()} sell",
+                            "order_type": sell_type.lower()
+                        })
+                        st.success(f"🛡️ [DRY_RUN] {sell_type} sell simulated: {qty_sell} x {symbol_sell}")
+                    else:
+                        try:
+                            with st.spinner(f"Placing {sell_type.lower()} sell order..."):
+                                if sell_type == "Limit":
+                                    resp = KITE.place_limit_sell(symbol_sell, int(qty_sell), float(price_sell))
+                                else:
+                                    resp = KITE.place_market_sell(symbol_sell, int(qty_sell))
                                 
-                            order_id = resp.get("order_id") if isinstance(resp, dict) else str(resp)
+                                order_id = resp.get("order_id") if isinstance(resp, dict) else str(resp)
                             
-                            save_trade(symbol_sell, int(qty_sell), f"SELL_{sell_type.upper()}", float(price_sell) if sell_type == "Limit" else 0.0, order_id, False, {
-                                "kite_resp": resp,
-                                "order_type": sell_type.lower()
-                            })
+                                save_trade(symbol_sell, int(qty_sell), f"SELL_{sell_type.upper()}", float(price_sell) if sell_type == "Limit" else 0.0, order_id, False, {
+                                    "kite_resp": resp,
+                                    "order_type": sell_type.lower()
+                                })
                             
-                            st.success(f"✅ {sell_type} sell order placed: {order_id}")
+                                st.success(f"✅ {sell_type} sell order placed: {order_id}")
                             
-                    except Exception as e:
-                        st.error(f"❌ Sell order failed: {str(e)}")
+                        except Exception as e:
+                            st.error(f"❌ Sell order failed: {str(e)}")
+                    
+                    # Commit this order's trade rows before the panel finishes rendering
+                    flush_trades()
+
+
+render_manual_actions()
 
 # 🛡️ Single Order Constraint Status
 st.subheader("🛡️ Position Constraint Status")
@@ -2916,11 +3933,11 @@ else:
     st.success("✅ **All Clear**: All watchlist symbols are available for new GTT orders.")
 
 # Quick actions for positions
-positions_df = load_positions_df()  # Load positions for quick actions
-if not positions_df.empty:
+held_rows = load_positions_rows(held_only=True)  # Load positions for quick actions
+if held_rows:
     st.subheader("⚡ Quick Position Actions")
     
-    for _, pos in positions_df.iterrows():
+    for pos in held_rows:
         if pos['qty'] > 0:
             col1, col2, col3, col4 = st.columns([2, 2, 2, 2])
             
@@ -2962,77 +3979,81 @@ if not positions_df.empty:
                         st.info("DRY_RUN: Would place market sell order")
 
 st.markdown("---")
-st.caption("Note: This is a prototype. Always test with DRY_RUN and testnet keys first. The app uses polling to fetch LTP and prev close; for production prefer KiteTicker websocket and robust order verification.")
+st.caption("Note: This is a prototype. Always test with DRY_RUN and testnet keys first. LTPs stream over KiteTicker (REST polling is the fallback when the websocket is down); verify orders independently before relying on them.")
 
 # --- Enhanced Dashboard Table ---
 # Place this in the main Streamlit UI section where the main table is rendered
 st.markdown("---")
 st.subheader("📈 Live ETF Market Data (Kite Style)")
 
-# Fetch and display real data for all ETFs in the watchlist
-data_rows = []
-for symbol in MONITOR_STATE["symbols"]:
-    ltp = fetch_ltp(symbol)
-    prev_close = fetch_prev_close(symbol)
-    gap = None
-    if ltp is not None and prev_close is not None and prev_close != 0:
-        gap = ((ltp - prev_close) / prev_close) * 100
-    else:
-        gap = None
-    # Try to get volume and OHLC if available
-    quote = KITE.quote(symbol) if KITE and KITE.kite else None
-    ohlc = quote.get(f"NSE:{symbol}", {}).get("ohlc", {}) if quote else {}
-    volume = quote.get(f"NSE:{symbol}", {}).get("volume", None) if quote else None
-    data_rows.append({
-        "Symbol": symbol,
-        "LTP": ltp,
-        "Prev Close": prev_close,
-        "Gap %": f"{gap:.2f}%" if gap is not None else "-",
-        "Open": ohlc.get("open", "-"),
-        "High": ohlc.get("high", "-"),
-        "Low": ohlc.get("low", "-"),
-        "Volume": volume if volume is not None else "-",
-    })
-
-# Display as a DataFrame/table
-import pandas as pd
-df = pd.DataFrame(data_rows)
-st.dataframe(df, use_container_width=True)
+# Numeric columns from the same batched quote; column_config formats them at render time
+market_ohlc = [watchlist_quotes.get(s, {}).get("ohlc") or {} for s in symbols]
+market_df = pd.DataFrame({
+    "Symbol": symbols,
+    "LTP": ltp_arr,
+    "Prev Close": prev_arr,
+    "Gap %": pct_arr,
+    "Open": np.array([o.get("open", np.nan) for o in market_ohlc], dtype=np.float64),
+    "High": np.array([o.get("high", np.nan) for o in market_ohlc], dtype=np.float64),
+    "Low": np.array([o.get("low", np.nan) for o in market_ohlc], dtype=np.float64),
+    "Volume": pd.array([watchlist_quotes.get(s, {}).get("volume") for s in symbols], dtype="Int64"),
+})
+st.dataframe(
+    market_df,
+    use_container_width=True,
+    hide_index=True,
+    column_config={
+        "LTP": st.column_config.NumberColumn(format="₹%.2f"),
+        "Prev Close": st.column_config.NumberColumn(format="₹%.2f"),
+        "Gap %": st.column_config.NumberColumn(format="%.2f%%"),
+        "Open": st.column_config.NumberColumn(format="₹%.2f"),
+        "High": st.column_config.NumberColumn(format="₹%.2f"),
+        "Low": st.column_config.NumberColumn(format="₹%.2f"),
+        "Volume": st.column_config.NumberColumn(format="%d"),
+    },
+)
 
 # --- ETF Candlestick Dashboard ---
 st.markdown("---")
 st.subheader("📊 ETF Candlestick & Volume Charts (Kite Style)")
 
-selected_etf = st.selectbox("Select ETF to view chart:", MONITOR_STATE["symbols"])
-
-ohlc_df = fetch_ohlc_history(selected_etf)
-if ohlc_df is not None and not ohlc_df.empty:
-    fig = go.Figure()
-    fig.add_trace(go.Candlestick(
-        x=ohlc_df['date'],
-        open=ohlc_df['open'],
-        high=ohlc_df['high'],
-        low=ohlc_df['low'],
-        close=ohlc_df['close'],
-        name='Candles',
-        increasing_line_color='green', decreasing_line_color='red',
-    ))
-    fig.add_trace(go.Bar(
-        x=ohlc_df['date'],
-        y=ohlc_df['volume'],
-        name='Volume',
-        marker_color='blue',
-        opacity=0.3,
-        yaxis='y2',
-    ))
-    fig.update_layout(
-        xaxis_rangeslider_visible=False,
-        yaxis_title='Price',
-        yaxis2=dict(title='Volume', overlaying='y', side='right', showgrid=False),
-        title=f"{selected_etf} - Candlestick & Volume",
-        height=600,
-        margin=dict(l=20, r=20, t=40, b=20),
-    )
-    st.plotly_chart(fig, use_container_width=True)
-else:
-    st.warning(f"No OHLC data available for {selected_etf}.")
\ No newline at end of file
+@fragment
+def render_candlestick_chart():
+    # Changing the selected ETF reruns only this chart, not the watchlist quote batch
+    selected_etf = st.selectbox("Select ETF to view chart:", MONITOR_STATE["symbols"])
+
+    ohlc_df = fetch_ohlc_history(selected_etf)
+    if ohlc_df is not None and not ohlc_df.empty:
+        ohlc_df = downsample_ohlc(ohlc_df)
+        fig = go.Figure()
+        fig.add_trace(go.Candlestick(
+            x=ohlc_df['date'],
+            open=ohlc_df['open'],
+            high=ohlc_df['high'],
+            low=ohlc_df['low'],
+            close=ohlc_df['close'],
+            name='Candles',
+            increasing_line_color='green', decreasing_line_color='red',
+        ))
+        fig.add_trace(go.Bar(
+            x=ohlc_df['date'],
+            y=ohlc_df['volume'],
+            name='Volume',
+            marker_color='blue',
+            opacity=0.3,
+            yaxis='y2',
+        ))
+        fig.update_layout(
+            xaxis_rangeslider_visible=False,
+            yaxis_title='Price',
+            yaxis2=dict(title='Volume', overlaying='y', side='right', showgrid=False),
+            title=f"{selected_etf} - Candlestick & Volume",
+            height=600,
+            margin=dict(l=20, r=20, t=40, b=20),
+        )
+        st.plotly_chart(fig, use_container_width=True)
+    else:
+        st.warning(f"No OHLC data available for {selected_etf}.")
+
+
+render_candlestick_chart()
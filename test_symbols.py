@@ -2,19 +2,56 @@
 """Test all symbols in watchlist to find valid ones"""
 
 import os
+import sys
+import json
 import time
-from dotenv import load_dotenv
-from kiteconnect import KiteConnect
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date
+from itertools import compress, islice
+
+
+def load_env_file(path=".env"):
+    """Minimal KEY=VALUE .env reader (comments/blank lines skipped, existing env wins); avoids importing python-dotenv"""
+    try:
+        with open(path, "r") as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#") or "=" not in line:
+                    continue
+                key, _, value = line.partition("=")
+                os.environ.setdefault(key.removeprefix("export ").strip(), value.strip().strip("\"'"))
+    except FileNotFoundError:
+        pass
+
 
 # Load environment variables
-load_dotenv()
+load_env_file()
+
+# Progress and failures go through logging: messages are only formatted when the level is enabled
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper(), format="%(message)s")
+log = logging.getLogger("test_symbols")
 
 API_KEY = os.getenv("KITE_API_KEY")
 ACCESS_TOKEN = os.getenv("KITE_ACCESS_TOKEN")
 
-# Initialize Kite
-kite = KiteConnect(api_key=API_KEY)
-kite.set_access_token(ACCESS_TOKEN)
+# Results are reused for the rest of the day; pass --refresh to re-check every symbol
+SYMBOL_CACHE_FILE = os.getenv("SYMBOL_CACHE_FILE", "symbol_check_cache.json")
+
+# Created by connect_kite() only when some symbol actually needs a quote
+kite = None
+
+
+def connect_kite():
+    # kiteconnect is imported here, so a fully cached run never pays for it.
+    # pool= mounts a keep-alive adapter on KiteConnect's single requests.Session,
+    # so every quote request (and any retry) reuses the same TLS connection
+    from kiteconnect import KiteConnect
+    client = KiteConnect(api_key=API_KEY, pool={"pool_connections": 10, "pool_maxsize": 20})
+    client.set_access_token(ACCESS_TOKEN)
+    return client
+
 
 # Test all symbols from the watchlist
 watchlist_symbols = [
@@ -31,36 +68,150 @@ watchlist_symbols = [
     "ICICIHDIV", "ICICIFINSERV", "ICICIHEALTH", "ICICIDIGITAL", "ICICIMANUF"
 ]
 
-print("Testing all watchlist symbols for valid prices...")
-valid_symbols = []
-invalid_symbols = []
+# Kite's quote endpoint accepts at most this many instruments per request
+QUOTE_BATCH_LIMIT = 500
 
-# Test in batches to avoid rate limits
-for i, symbol in enumerate(watchlist_symbols):
-    nse_symbol = f"NSE:{symbol}"
-    try:
-        quote = kite.quote(nse_symbol)
-        if nse_symbol in quote and 'last_price' in quote[nse_symbol]:
-            ltp = quote[nse_symbol]['last_price']
-            if ltp > 0:  # Valid price
-                valid_symbols.append(symbol)
-                print(f"✅ {symbol}: ₹{ltp}")
+# Kite's quote rate limit (requests per second)
+QUOTE_RATE_LIMIT = 3
+
+# Per-symbol probes in flight at once when a batch fails and symbols are checked individually
+PROBE_CONCURRENCY = 10
+
+
+class TokenBucket:
+    """`rate` calls per second; acquire() only sleeps when the bucket is empty, for the exact deficit"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = float(rate)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+
+
+QUOTE_BUCKET = TokenBucket(QUOTE_RATE_LIMIT)
+
+
+def rate_limited_quote(instruments):
+    QUOTE_BUCKET.acquire()
+    return kite.quote(instruments)
+
+
+def probe_symbols(nse_symbols):
+    """
+    Quote each symbol on its own so one bad ticker can't hide the rest; probes overlap on
+    PROBE_CONCURRENCY threads (requests releases the GIL during network I/O) and share the
+    pooled Kite session. Returns (quotes, errors) keyed by 'NSE:SYMBOL'.
+    """
+    quotes, errors = {}, {}
+
+    def probe(nse_symbol):
+        try:
+            return nse_symbol, rate_limited_quote(nse_symbol), None
+        except Exception as e:
+            return nse_symbol, None, e
+
+    with ThreadPoolExecutor(max_workers=PROBE_CONCURRENCY) as executor:
+        for future in as_completed([executor.submit(probe, s) for s in nse_symbols]):
+            nse_symbol, result, error = future.result()
+            if error is None:
+                quotes.update(result)
             else:
-                invalid_symbols.append(symbol)
-                print(f"❌ {symbol}: Zero price")
-        else:
-            invalid_symbols.append(symbol)
-            print(f"❌ {symbol}: No price data")
+                errors[nse_symbol] = error  # formatted only if it ends up in the report
+    return quotes, errors
+
+
+log.info("Testing all watchlist symbols for valid prices...")
+# Kite instrument names, built once and shared by the quote requests, cache and report
+nse_symbols = [f"NSE:{symbol}" for symbol in watchlist_symbols]
+
+# valid_mask[i] is 1 when watchlist_symbols[i] has a positive price
+valid_mask = bytearray(len(watchlist_symbols))
+
+# Today's cached results: symbol -> last price (None when Kite returned no price data)
+today = date.today().isoformat()
+cached_ltps = {}
+if "--refresh" not in sys.argv:
+    try:
+        with open(SYMBOL_CACHE_FILE, "r") as f:
+            cached = json.load(f)
+        if cached.get("date") == today:
+            cached_ltps = cached["ltps"]
+    except (FileNotFoundError, ValueError, KeyError):
+        pass
+
+quote = {}
+uncached = []
+for symbol, nse_symbol in zip(watchlist_symbols, nse_symbols):
+    if symbol not in cached_ltps:
+        uncached.append((symbol, nse_symbol))
+    elif cached_ltps[symbol] is not None:
+        quote[nse_symbol] = {"last_price": cached_ltps[symbol]}
+errors = {}
+
+# One quote request per QUOTE_BATCH_LIMIT instruments instead of one per symbol
+instruments = [nse_symbol for _, nse_symbol in uncached]
+if cached_ltps:
+    log.info("Using today's cached results for %d symbols", len(watchlist_symbols) - len(instruments))
+if instruments:
+    kite = connect_kite()
+batches = iter(instruments)
+while True:
+    batch = list(islice(batches, QUOTE_BATCH_LIMIT))
+    if not batch:
+        break
+    try:
+        quote.update(rate_limited_quote(batch))
     except Exception as e:
-        invalid_symbols.append(symbol)
-        print(f"❌ {symbol}: {str(e)}")
-    
-    # Small delay to avoid rate limits
-    if i % 10 == 9:
-        time.sleep(1)
-
-print(f"\n📊 SUMMARY:")
-print(f"✅ Valid symbols: {len(valid_symbols)}")
-print(f"❌ Invalid symbols: {len(invalid_symbols)}")
-print(f"\n🔧 VALID WATCHLIST (copy this to .env):")
-print(",".join(valid_symbols))
\ No newline at end of file
+        log.warning("⚠️ Quote batch of %d symbols failed (%s) - probing symbols individually", len(batch), e)
+        batch_quotes, batch_errors = probe_symbols(batch)
+        quote.update(batch_quotes)
+        errors.update(batch_errors)
+
+if instruments:
+    # Cache everything Kite answered for; symbols that errored are retried on the next run
+    for symbol, nse_symbol in uncached:
+        if nse_symbol not in errors:
+            data = quote.get(nse_symbol)
+            cached_ltps[symbol] = data.get('last_price') if data else None
+    tmp_file = f"{SYMBOL_CACHE_FILE}.tmp"
+    with open(tmp_file, "w") as f:
+        json.dump({"date": today, "ltps": cached_ltps}, f)
+    os.replace(tmp_file, SYMBOL_CACHE_FILE)
+
+# Report lines are collected and written once at the end instead of one print per symbol
+report = []
+for i, (symbol, nse_symbol) in enumerate(zip(watchlist_symbols, nse_symbols)):
+    # One probe into the response; a missing symbol or field reads as None
+    data = quote.get(nse_symbol)
+    ltp = data.get('last_price') if data else None
+    valid = ltp is not None and ltp > 0
+    valid_mask[i] = valid
+    if valid:
+        report.append(f"✅ {symbol}: ₹{ltp}")
+    elif ltp is not None:
+        report.append(f"❌ {symbol}: Zero price")
+    else:
+        report.append(f"❌ {symbol}: {errors.get(nse_symbol, 'No price data')}")
+
+valid_count = sum(valid_mask)
+report += [
+    "",
+    "📊 SUMMARY:",
+    f"✅ Valid symbols: {valid_count}",
+    f"❌ Invalid symbols: {len(watchlist_symbols) - valid_count}",
+    "",
+    "🔧 VALID WATCHLIST (copy this to .env):",
+    ",".join(compress(watchlist_symbols, valid_mask)),
+]
+sys.stdout.write("\n".join(report) + "\n")
+sys.stdout.flush()